@@ -67,3 +67,15 @@ def upload_file(bucket, key, source):
     """
     client = boto3.client("s3")
     client.upload_file(source, bucket, key)
+
+
+def is_missing(error):
+    """
+    Check if an S3 request failed because the object does not exist, e.g.
+    to tell it apart from access denied or throttling errors.
+
+    :param botocore.exceptions.ClientError error: error of the request
+    :return bool: True if the object does not exist
+    """
+    code = error.response.get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
@@ -0,0 +1,124 @@
+"""
+Compare harvest storage codecs on harvested web pages.
+
+Pages are read from the archives of a ZipHarvestStore and compressed one by
+one, as they are when harvested. For each codec, prints the compression ratio
+and compression and decompression speeds in MB/s of uncompressed data.
+
+The zstd dictionary is trained on every other page, and all codecs are
+benchmarked on the other half of the pages, which the dictionary has not
+seen, so its ratio is not inflated.
+
+Usage:
+    python benchmark_codecs.py HARVEST_DIR [--limit N] [--codecs bz2,zstd]
+"""
+import argparse
+import time
+
+import constants as cst
+
+from harvest_codecs import CODECS, get_codec, train_zstd_dictionary
+from harvest_managers import ZipHarvestStore
+
+
+def load_pages(harvest_dir, limit, codec):
+    """
+    Read harvested web pages.
+
+    :param str harvest_dir: directory of the harvest archives
+    :param int limit: maximum number of pages to read
+    :param str codec: codec the archives were written with
+    :return list[bytes]: contents of web pages
+    """
+    store = ZipHarvestStore(harvest_dir, codec=codec)
+    pages = []
+    while len(store) > 0 and len(pages) < limit:
+        _, content = store.get()
+        pages.append(content.encode())
+    return pages
+
+
+def benchmark(codec, pages):
+    """
+    Compress and decompress pages one by one.
+
+    :param object codec: codec to benchmark
+    :param list[bytes] pages: contents of web pages
+    :return dict: compression ratio and speeds in MB/s
+    """
+    size = sum(len(p) for p in pages)
+
+    start = time.perf_counter()
+    compressed = [codec.compress(p) for p in pages]
+    compress_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for c in compressed:
+        codec.decompress(c)
+    decompress_time = time.perf_counter() - start
+
+    return {
+        "ratio": size / sum(len(c) for c in compressed),
+        "compress": size / compress_time / 1e6,
+        "decompress": size / decompress_time / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("harvest_dir", help="directory of harvest archives")
+    parser.add_argument(
+        "--archive-codec",
+        default=cst.HARVEST_CODEC,
+        help="codec the archives were written with",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=1000,
+        help="maximum number of pages to benchmark",
+    )
+    parser.add_argument(
+        "--codecs",
+        default=",".join(CODECS),
+        help="comma-separated list of codecs to benchmark",
+    )
+    args = parser.parse_args()
+
+    pages = load_pages(args.harvest_dir, args.limit, args.archive_codec)
+    if len(pages) < 2:
+        raise SystemExit(
+            f"at least 2 harvested pages are needed in {args.harvest_dir}"
+        )
+    training, held_out = pages[::2], pages[1::2]
+    size = sum(len(p) for p in held_out)
+    print(
+        f"{len(held_out)} pages, {size / 1e6:.1f} MB "
+        f"({len(training)} other pages to train the zstd dictionary)"
+    )
+
+    codecs = []
+    for name in args.codecs.split(","):
+        try:
+            codecs.append((name, get_codec(name)))
+        except ImportError as e:
+            print(f"skipping {name}: {e}")
+            continue
+        if name == "zstd":
+            dictionary = train_zstd_dictionary(training)
+            codecs.append(
+                ("zstd+dict", get_codec(name, dictionary=dictionary))
+            )
+
+    print(f"{'codec':<12}{'ratio':>8}{'compress':>14}{'decompress':>14}")
+    for name, codec in codecs:
+        result = benchmark(codec, held_out)
+        print(
+            f"{name:<12}{result['ratio']:>8.2f}"
+            f"{result['compress']:>9.1f} MB/s"
+            f"{result['decompress']:>9.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
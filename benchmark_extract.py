@@ -0,0 +1,338 @@
+"""
+Benchmark the extraction of data from harvested web pages.
+
+The corpus is a directory with a subdirectory of ZipHarvestStore archives per
+website, e.g. CORPUS_DIR/cityrealty, which should not change between runs so
+results can be compared over time. Each website is benchmarked in its own
+process so peak memory usage is measured per website. For each parser,
+reports pages per second, the median (p50) and 99th percentile (p99)
+latencies of parsing a page, the peak resident memory (RSS) of the process,
+and the latency and peak memory allocated by each field getter. Getters of
+field specs take the tags found by the spec's parse plan, which is run once
+per page and timed separately ('prepare'). Results are printed as JSON.
+
+Usage:
+    python benchmark_extract.py CORPUS_DIR [--sites cityrealty,zizi]
+        [--limit N] [--output results.json]
+"""
+import argparse
+import importlib
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+from datetime import datetime
+from functools import partial
+
+from bs4 import BeautifulSoup
+
+import constants as cst
+
+from harvest_managers import ZipHarvestStore
+
+SITES = ("cityrealty", "craigslist", "nytimes", "zizi", "realtor")
+
+
+def load_pages(harvest_dir, limit, codec):
+    """
+    Read harvested web pages.
+
+    :param str harvest_dir: directory of the harvest archives
+    :param int limit: maximum number of pages to read
+    :param str codec: codec the archives were written with
+    :return list[bytes]: contents of web pages
+    """
+    store = ZipHarvestStore(harvest_dir, codec=codec)
+    pages = []
+    while len(store) > 0 and len(pages) < limit:
+        _, content = store.get()
+        pages.append(content.encode())
+    return pages
+
+
+def peak_rss():
+    """
+    :return float: peak resident memory of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / 1e6
+    return peak / 1e3
+
+
+def percentile(sorted_values, p):
+    """
+    :param list[float] sorted_values: values sorted in increasing order
+    :param float p: percentile, between 0 and 100
+    :return float: value at the percentile
+    """
+    index = round(p / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+def time_pages(func, inputs):
+    """
+    Time a function on each page.
+
+    :param callable func: function to time
+    :param list inputs: argument of each call
+    :return dict: pages per second, p50 and p99 latencies in milliseconds,
+        and number of calls which raised an exception
+    """
+    latencies = []
+    errors = 0
+    for arg in inputs:
+        start = time.perf_counter()
+        try:
+            func(arg)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        "pages_per_sec": len(latencies) / total if total else None,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "errors": errors,
+    }
+
+
+def peak_alloc(func, inputs):
+    """
+    :param callable func: function to measure
+    :param list inputs: argument of each call
+    :return float: peak memory allocated by Python during a call in KB
+    """
+    peak = 0
+    tracemalloc.start()
+    for arg in inputs:
+        tracemalloc.reset_peak()
+        try:
+            func(arg)
+        except Exception:
+            pass
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    return peak / 1e3
+
+
+def benchmark_getters(getters, inputs):
+    """
+    Time each getter on already parsed pages.
+
+    :param dict getters: names of getters mapped to functions which take a
+        parsed page
+    :param list inputs: parsed pages, or what the getters take instead,
+        e.g. the tags found by a parse plan
+    :return dict: names of getters mapped to their latencies and peak
+        allocated memory
+    """
+    results = {}
+    for name, getter in getters.items():
+        result = time_pages(getter, inputs)
+        result["peak_alloc_kb"] = peak_alloc(getter, inputs)
+        results[name] = result
+    return results
+
+
+def soup_getters(module):
+    """
+    :param module module: parse_soup module of a website
+    :return dict: names of the getters of the module mapped to the getters
+    """
+    return {
+        name: func
+        for name, func in inspect.getmembers(module, inspect.isfunction)
+        if name.startswith("get_") and func.__module__ == module.__name__
+    }
+
+
+def spec_getters(extractor):
+    """
+    Make functions which extract one field of a spec from the tags found in
+    a page by the extractor's parse plan, so the plan, which finds the tags
+    of all fields at once, is not timed with each field.
+
+    :param Extractor extractor: extractor of a website
+    :return dict: names of fields mapped to functions which take the result
+        of extractor.plan.run()
+    """
+    def getter(indexes, process, found):
+        return process(*(found[i] for i in indexes))
+
+    return {
+        name: partial(getter, indexes, process)
+        for name, indexes, process, _ in extractor.fields
+        if indexes
+    }
+
+
+def get_parsers(site, html_parser):
+    """
+    Get the parsers of a website.
+
+    :param str site: website name
+    :param str html_parser: parser to use with BeautifulSoup
+    :return dict: names of parsers mapped to (function which parses HTML,
+        function which extracts data from the parsed page, getters, function
+        which prepares the input of the getters from the parsed page or None
+        if they take the parsed page)
+    """
+    if site == "realtor":
+        # realtor scripts import their own 'utils' and 'constants' modules,
+        # this process only benchmarks realtor so the repository's modules
+        # of the same names can be dropped
+        root = os.path.dirname(os.path.abspath(__file__))
+        site_dir = os.path.join(root, site)
+        sys.path.insert(0, site_dir)
+        for file_name in os.listdir(site_dir):
+            name, extension = os.path.splitext(file_name)
+            if extension == ".py":
+                sys.modules.pop(name, None)
+        module = importlib.import_module("download_description")
+        return {
+            "parse_description_from_html": (
+                lambda content: content,
+                module.parse_description_from_html,
+                {},
+                None,
+            ),
+        }
+
+    module = importlib.import_module(f"{site}.parse_soup")
+    return {
+        "parse_webpage": (
+            partial(BeautifulSoup, features=html_parser),
+            module.parse_webpage,
+            soup_getters(module),
+            None,
+        ),
+        "parse_tree": (
+            module.parse_html,
+            module.parse_tree,
+            spec_getters(module.EXTRACTOR),
+            module.EXTRACTOR.plan.run,
+        ),
+    }
+
+
+def benchmark_site(site, site_dir, limit, codec, html_parser):
+    """
+    Benchmark the parsers of a website, this runs in a separate process.
+
+    :param str site: website name
+    :param str site_dir: directory of the website's harvest archives
+    :param int limit: maximum number of pages to benchmark
+    :param str codec: codec the archives were written with
+    :param str html_parser: parser to use with BeautifulSoup
+    :return dict: results
+    """
+    try:
+        parsers = get_parsers(site, html_parser)
+    except ImportError as e:
+        return {"skipped": str(e)}
+    # getters log an error for each missing tag
+    logging.disable(logging.CRITICAL)
+
+    pages = load_pages(site_dir, limit, codec)
+    results = {
+        "pages": len(pages),
+        "mb": sum(len(p) for p in pages) / 1e6,
+        "corpus_rss_mb": peak_rss(),
+        "parsers": {},
+    }
+    if not pages:
+        return results
+
+    for name, (parse, extract, getters, prepare) in parsers.items():
+        trees = [parse(p) for p in pages]
+        result = time_pages(lambda page: extract(parse(page)), pages)
+        result["parse"] = time_pages(parse, pages)
+        result["extract"] = time_pages(extract, trees)
+        inputs = trees
+        if prepare is not None:
+            # prepared once per page, so only the getters themselves are
+            # timed below
+            result["prepare"] = time_pages(prepare, trees)
+            inputs = [prepare(tree) for tree in trees]
+        result["getters"] = benchmark_getters(getters, inputs)
+        del trees, inputs
+        results["parsers"][name] = result
+
+    results["peak_rss_mb"] = peak_rss()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "corpus_dir",
+        help="directory with a subdirectory of harvest archives per website",
+    )
+    parser.add_argument(
+        "--sites",
+        default=",".join(SITES),
+        help="comma-separated list of websites to benchmark",
+    )
+    parser.add_argument(
+        "--archive-codec",
+        default=cst.HARVEST_CODEC,
+        help="codec the archives were written with",
+    )
+    parser.add_argument(
+        "--html-parser",
+        default="html.parser",
+        help="parser to use with BeautifulSoup",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=1000,
+        help="maximum number of pages to benchmark per website",
+    )
+    parser.add_argument("--output", help="path of the JSON results file")
+    args = parser.parse_args()
+
+    results = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "html_parser": args.html_parser,
+        "sites": {},
+    }
+    # a fresh process per website, so peak memory is not shared
+    context = multiprocessing.get_context("spawn")
+    for site in args.sites.split(","):
+        site_dir = os.path.join(args.corpus_dir, site)
+        if not os.path.isdir(site_dir):
+            results["sites"][site] = {"skipped": f"{site_dir} not found"}
+            continue
+        with context.Pool(1) as pool:
+            results["sites"][site] = pool.apply(
+                benchmark_site,
+                (
+                    site,
+                    site_dir,
+                    args.limit,
+                    args.archive_codec,
+                    args.html_parser,
+                ),
+            )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
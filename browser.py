@@ -1,6 +1,14 @@
+import asyncio
 import logging
+import threading
 import time
 
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from configparser import ConfigParser
 from functools import partial
 from pathlib import Path
@@ -9,7 +17,39 @@ from bs4 import BeautifulSoup
 
 import constants as cst
 
-from utils import cut_url
+from harvest_managers import read_archive
+from utils import BoundedQueue, cut_url, TokenBucketScheduler
+
+# archives opened by extract worker processes, kept open between batches
+_worker_archives = {}
+
+
+def _extract_batch(
+    archive_path,
+    file_names,
+    codec,
+    html_parser,
+    soup_parser,
+):
+    """
+    Parse a batch of web pages stored in the same archive. This runs in a
+    worker process of Browser.extract().
+
+    :param str archive_path: path to the archive
+    :param list file_names: names of the web pages in the archive
+    :param object codec: codec the archive was written with
+    :param callable html_parser: function which builds the tags soup, or
+        the tree parsed by soup_parser
+    :param callable soup_parser: function which parses the tags soup into a
+        dictionary
+    :returns (list): parsed records
+    """
+    records = []
+    pages = read_archive(archive_path, file_names, _worker_archives, codec)
+    for file_name, content in pages:
+        soup = html_parser(content)
+        records.append(soup_parser(soup))
+    return records
 
 
 class Browser:
@@ -27,6 +67,7 @@ class Browser:
         download_manager=None,
         html_parser="html.parser",
         soup_parser=None,
+        extract_parser=None,
         harvest_store=None,
         extract_store=None,
     ):
@@ -42,13 +83,18 @@ class Browser:
             of the next page to harvest
         :param callable get_page_id: function which shortens the URL into a
             unique ID
-        :param str html_parser: parser to use with BeautifulSoup, e.g.
-            'html.parser', 'lxml', etc
+        :param str|callable html_parser: parser to use with BeautifulSoup,
+            e.g. 'html.parser', 'lxml', etc, or function which parses HTML
         :param soup_parser: function to use to parse the HTML tags soup into
             a dictionary
+        :param callable extract_parser: function which parses HTML into the
+            tree passed to soup_parser when extracting data, defaults to
+            html_parser, e.g. parse_plan.parse_html to extract with lxml
         :param str config_path: path to the browser configuration file
         :param class explored_set: Object to store a set of explored web pages.
-            Must have methods named 'add' and '__contains__'.
+            Must have methods named 'add' and '__contains__'. Only pages to
+            harvest are added, pages to browse are explored again by each
+            run to find new listings.
         :param class browse_queue: Object to store a queue of web pages to
             browse. This must have methods named 'enqueue' and 'dequeue'.
         :param class parse_queue: Object to store a queue of web pages to
@@ -73,12 +119,19 @@ class Browser:
         self.harvest_store = harvest_store
         self.extract_store = extract_store
         self.archive_count = 1
-        self.pauses = 0
+        # harvest workers back off independently, see pauses
+        self.local = threading.local()
+        self.store_lock = threading.Lock()
+        # pages browsed during the current run
+        self.browsed = set()
 
         if not html_parser:
             self.html_parser = partial(BeautifulSoup, features="html.parser")
+        elif callable(html_parser):
+            self.html_parser = html_parser
         else:
             self.html_parser = partial(BeautifulSoup, features=html_parser)
+        self.extract_parser = extract_parser or self.html_parser
 
     def configure(self, config_path):
         """
@@ -100,6 +153,17 @@ class Browser:
             filemode="a"
         )
 
+    @property
+    def pauses(self):
+        """
+        Number of consecutive pauses of the current thread.
+        """
+        return getattr(self.local, "pauses", 0)
+
+    @pauses.setter
+    def pauses(self, value):
+        self.local.pauses = value
+
     def pause(self):
         """
         Pause browser if no message is returned from the queue.
@@ -112,21 +176,37 @@ class Browser:
         time.sleep(duration)
         self.pauses += 1
 
-    def browse(self, initial=None):
+    async def pause_async(self):
+        """
+        Same as pause() but does not block the event loop.
+        """
+        duration = min(
+            cst.PAUSE_BACKOFF * 2 ** self.pauses,
+            cst.PAUSE_MAX
+        )
+        await asyncio.sleep(duration)
+        self.pauses += 1
+
+    def browse(self, initial=None, harvest_queue=None, scheduler=None):
         """
         Crawl the web in a breadth-first search fashion, find pages to extract
         and store them in self.harvest_queue.
 
         :param str initial: URL where to start browsing (suffix to append
             to the base URL)
+        :param object harvest_queue: queue where to store pages to harvest,
+            defaults to self.harvest_queue
+        :param TokenBucketScheduler scheduler: if given, wait for the
+            scheduler before each download instead of sleeping after it
         """
         logging.info("start browsing")
         if not initial:
             initial = self.base_url
 
-        if initial not in self.explored_set:
+        # a queue which is not empty is resumed from a previous run
+        self.browsed = {initial}
+        if self.browse_queue.is_empty:
             self.browse_queue.enqueue(initial)
-            self.explored_set.add(initial)
 
         while not self.browse_queue.is_empty:
             current = self.browse_queue.dequeue()
@@ -137,50 +217,188 @@ class Browser:
 
             self.pauses = 0
 
+            if scheduler and not self._cached(current):
+                scheduler.wait(current)
+
             logging.info(f"downloading {cut_url(current)}")
-            content = self.download_manager.download_page(url=current)
+            content = self._download_browsed(current)
 
-            self.download_manager.sleep()
+            if not scheduler:
+                self.download_manager.sleep()
 
-            # if download failed, push URL back to queue
+            # if download failed, give URL back to queue
             if content is None:
-                self.browse_queue.enqueue(current)
+                self._nack(self.browse_queue, current)
                 continue
 
             # if download is forbidden, skip
             if content == cst.FORBIDDEN:
+                self._ack(self.browse_queue, current)
                 continue
 
-            logging.info("parsing HTML code")
-            soup = self.html_parser(content)
+            stop = self._explore(content, harvest_queue)
+            self._ack(self.browse_queue, current)
+            if stop:
+                break
 
-            # get list of web links to harvest
-            for child in self.get_harvestable(soup):
-                if child in self.explored_set:
-                    continue
-                logging.info(f"found to harvest {cut_url(child)}")
-                self.explored_set.add(child)
-                self.harvest_queue.enqueue(child)
-
-            # check if we're at the last page
-            # if yes return, else get next page of listings
-            if self.stop_test(soup):
-                logging.info("reached last page to browse, stopping")
-                return
+        self.flush_queues()
 
-            for child in self.get_browsable(soup):
-                if child in self.explored_set:
-                    continue
-                logging.info(f"found to browse next {cut_url(child)}")
-                self.explored_set.add(child)
-                self.browse_queue.enqueue(child)
+    def _cached(self, url):
+        """
+        Check if the download manager has a web page in its cache, e.g.
+        CachedDownloadManager, so the page is not downloaded and the
+        request delay can be skipped.
+
+        :param str url: URL of the web page
+        :return bool:
+        """
+        cached = getattr(self.download_manager, "cached", None)
+        return cached is not None and cached(url)
+
+    def _download_browsed(self, url):
+        """
+        Download a page to browse. Browsed pages, e.g. listing indexes, must
+        be explored even if they did not change since they were last
+        downloaded, so they are downloaded without conditional requests.
+
+        :param str url: URL of the page
+        :return: contents of the page, or a coroutine with asynchronous
+            download managers
+        """
+        if getattr(self.download_manager, "validators", None) is None:
+            return self.download_manager.download_page(url=url)
+        return self.download_manager.download_page(
+            url=url,
+            conditional=False,
+        )
+
+    def flush_queues(self):
+        """
+        Send items buffered by queues which have a 'flush' method, e.g.
+        SQSQueue with batches, and release items leased by queues which have
+        a 'release' method. Also commit the validators and the cache index
+        of the download manager, if any, e.g. CachedDownloadManager.
+        """
+        for q in (self.browse_queue, self.harvest_queue):
+            for method in ("flush", "release"):
+                func = getattr(q, method, None)
+                if func:
+                    func()
+        validators = getattr(self.download_manager, "validators", None)
+        if validators is not None:
+            validators.flush()
+        flush = getattr(self.download_manager, "flush", None)
+        if flush:
+            flush()
+
+    @staticmethod
+    def _ack(queue, item):
+        """
+        Tell the queue that an item was processed, if the queue supports
+        acknowledgements, e.g. SQSQueue with leases.
+
+        :param object queue: queue the item was dequeued from
+        :param str item: processed item
+        """
+        ack = getattr(queue, "ack", None)
+        if ack:
+            ack(item)
+
+    @staticmethod
+    def _nack(queue, item):
+        """
+        Give an item which could not be processed back to the queue.
+
+        :param object queue: queue the item was dequeued from
+        :param str item: item to process again
+        """
+        nack = getattr(queue, "nack", None)
+        if nack:
+            nack(item)
+        else:
+            queue.enqueue(item)
+
+    def _explore(self, content, harvest_queue=None):
+        """
+        Parse a browsed page, queue the pages found to harvest and to browse
+        next.
+
+        :param bytes content: HTML code of the browsed page
+        :param object harvest_queue: queue where to store pages to harvest,
+            defaults to self.harvest_queue
+        :return bool: True if the last page to browse was reached
+        """
+        if harvest_queue is None:
+            harvest_queue = self.harvest_queue
+        logging.info("parsing HTML code")
+        soup = self.html_parser(content)
+
+        # get list of web links to harvest
+        for child in self.get_harvestable(soup):
+            if child in self.explored_set:
+                continue
+            logging.info(f"found to harvest {cut_url(child)}")
+            self.explored_set.add(child)
+            harvest_queue.enqueue(child)
+
+        # check if we're at the last page
+        # if yes return, else get next page of listings
+        if self.stop_test(soup):
+            logging.info("reached last page to browse, stopping")
+            return True
+
+        for child in self.get_browsable(soup):
+            if child in self.browsed:
+                continue
+            logging.info(f"found to browse next {cut_url(child)}")
+            self.browsed.add(child)
+            self.browse_queue.enqueue(child)
 
-    def harvest(self):
+        return False
+
+    def harvest(self, workers=cst.HARVEST_WORKERS):
         """
         Download the web pages stored in self.harvest_queue and save the data.
+
+        When several workers are used, they share a per-host token bucket so
+        the download manager's request delay is honoured across all workers
+        combined, instead of each worker sleeping after its own downloads.
+        Workers are threads sharing the download manager, which must be
+        thread-safe: SimpleDownloadManager, TorDownloadManager and
+        FirefoxDownloadManager are, and so is CachedDownloadManager
+        wrapping one of them. Tor and Firefox downloads wait for a free
+        circuit or driver, so use at least as many as workers.
+        AsyncDownloadManager only works with harvest_async().
+
+        :param int workers: number of concurrent download workers
         """
         logging.info("start harvesting")
 
+        if workers > 1:
+            scheduler = TokenBucketScheduler(
+                self.base_url,
+                self.download_manager.request_delay,
+            )
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(self._harvest_worker, scheduler)
+                    for _ in range(workers)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            self._harvest_worker()
+
+        self.flush_queues()
+        logging.info("finished harvesting")
+
+    def _harvest_worker(self, scheduler=None):
+        """
+        Harvest pages from self.harvest_queue until it is empty.
+
+        :param TokenBucketScheduler scheduler: if given, wait for the
+            scheduler before each download instead of sleeping after it
+        """
         while not self.harvest_queue.is_empty:
             current = self.harvest_queue.dequeue()
             if not current:
@@ -190,39 +408,424 @@ class Browser:
 
             self.pauses = 0
 
+            if scheduler and not self._cached(current):
+                scheduler.wait(current)
+
             logging.info(f"downloading {cut_url(current)}")
             content = self.download_manager.download_page(url=current)
 
-            self.download_manager.sleep()
+            if not scheduler:
+                self.download_manager.sleep()
 
-            # if download failed, push URL back to queue
+            # if download failed, give URL back to queue
             if content is None:
-                self.harvest_queue.enqueue(current)
+                self._nack(self.harvest_queue, current)
                 continue
 
-            # if download is forbidden, skip
-            if content == cst.FORBIDDEN:
+            # if download is forbidden or page did not change, skip
+            if content in (cst.FORBIDDEN, cst.NOT_MODIFIED):
+                self._ack(self.harvest_queue, current)
                 continue
 
-            logging.info(f"storing {cut_url(current)}")
-            file_name = self.get_page_id(current)
+            # only delete the URL from the queue once the page is stored
+            self._store(current, content)
+            self._ack(self.harvest_queue, current)
+
+    def _store(self, url, content):
+        """
+        Save a harvested web page in self.harvest_store.
+
+        :param str url: URL of the harvested page
+        :param bytes content: HTML code of the harvested page
+        """
+        logging.info(f"storing {cut_url(url)}")
+        file_name = self.get_page_id(url)
+        with self.store_lock:
             self.harvest_store.put(file_name, content)
+        self._save_validators(url)
+
+    def _save_validators(self, url):
+        """
+        Save the validators of a processed web page, if the download manager
+        sends conditional requests, so it is reported as not modified next
+        time. This is only done once the page is stored, or extracted if
+        pages are not stored, so a page which could not be processed is
+        downloaded again.
+
+        :param str url: URL of the web page
+        """
+        validators = getattr(self.download_manager, "validators", None)
+        if validators is not None:
+            validators.save(url)
+
+    async def browse_async(self, initial=None, workers=cst.ASYNC_WORKERS):
+        """
+        Same as browse() but downloads pages concurrently from an asyncio
+        event loop. The download manager must have coroutine methods
+        'download_page' and 'close', e.g. AsyncDownloadManager.
+
+        Queue operations are blocking, so they run in the default executor.
+
+        :param str initial: URL where to start browsing (suffix to append
+            to the base URL)
+        :param int workers: maximum number of pages downloaded concurrently
+        """
+        logging.info("start browsing")
+        if not initial:
+            initial = self.base_url
+
+        # a queue which is not empty is resumed from a previous run
+        self.browsed = {initial}
+        if self.browse_queue.is_empty:
+            self.browse_queue.enqueue(initial)
+
+        scheduler = TokenBucketScheduler(
+            self.base_url,
+            self.download_manager.request_delay,
+        )
+        stop = asyncio.Event()
+        busy = 0
+
+        async def worker():
+            nonlocal busy
+            while not stop.is_set():
+                current = await asyncio.to_thread(self.browse_queue.dequeue)
+                if not current:
+                    # other workers may still find pages to browse
+                    if busy == 0 and await self._is_empty_async(
+                        self.browse_queue
+                    ):
+                        return
+                    logging.info("empty message received from queue, pausing")
+                    await self.pause_async()
+                    continue
+
+                self.pauses = 0
+                busy += 1
+                try:
+                    if not self._cached(current):
+                        await scheduler.wait_async(current)
+
+                    logging.info(f"downloading {cut_url(current)}")
+                    content = await self._download_browsed(current)
+
+                    # if download failed, give URL back to queue
+                    if content is None:
+                        await asyncio.to_thread(
+                            self._nack, self.browse_queue, current
+                        )
+                        continue
+
+                    # if download is forbidden, skip
+                    if content == cst.FORBIDDEN:
+                        await asyncio.to_thread(
+                            self._ack, self.browse_queue, current
+                        )
+                        continue
+
+                    if await asyncio.to_thread(self._explore, content):
+                        stop.set()
+                    await asyncio.to_thread(
+                        self._ack, self.browse_queue, current
+                    )
+                finally:
+                    busy -= 1
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            await self.download_manager.close()
+
+        await asyncio.to_thread(self.flush_queues)
+
+    async def harvest_async(self, workers=cst.ASYNC_WORKERS):
+        """
+        Same as harvest() but downloads pages concurrently from an asyncio
+        event loop, which allows to keep hundreds of requests in flight.
+        The download manager must have coroutine methods 'download_page' and
+        'close', e.g. AsyncDownloadManager.
 
+        :param int workers: maximum number of pages downloaded concurrently
+        """
+        logging.info("start harvesting")
+
+        scheduler = TokenBucketScheduler(
+            self.base_url,
+            self.download_manager.request_delay,
+        )
+        try:
+            await asyncio.gather(*(
+                self._harvest_worker_async(scheduler) for _ in range(workers)
+            ))
+        finally:
+            await self.download_manager.close()
+
+        await asyncio.to_thread(self.flush_queues)
         logging.info("finished harvesting")
 
-    def extract(self):
+    async def _harvest_worker_async(self, scheduler):
+        """
+        Harvest pages from self.harvest_queue until it is empty.
+
+        :param TokenBucketScheduler scheduler: politeness scheduler shared
+            by all workers
+        """
+        while not await self._is_empty_async(self.harvest_queue):
+            current = await asyncio.to_thread(self.harvest_queue.dequeue)
+            if not current:
+                logging.info("empty message received from queue, pausing")
+                await self.pause_async()
+                continue
+
+            self.pauses = 0
+
+            if not self._cached(current):
+                await scheduler.wait_async(current)
+
+            logging.info(f"downloading {cut_url(current)}")
+            content = await self.download_manager.download_page(url=current)
+
+            # if download failed, give URL back to queue
+            if content is None:
+                await asyncio.to_thread(
+                    self._nack, self.harvest_queue, current
+                )
+                continue
+
+            # if download is forbidden or page did not change, skip
+            if content in (cst.FORBIDDEN, cst.NOT_MODIFIED):
+                await asyncio.to_thread(
+                    self._ack, self.harvest_queue, current
+                )
+                continue
+
+            # only delete the URL from the queue once the page is stored
+            await asyncio.to_thread(self._store, current, content)
+            await asyncio.to_thread(self._ack, self.harvest_queue, current)
+
+    @staticmethod
+    async def _is_empty_async(queue):
+        return await asyncio.to_thread(getattr, queue, "is_empty")
+
+    def extract(
+        self,
+        workers=cst.EXTRACT_WORKERS,
+        batch_size=cst.EXTRACT_BATCH_SIZE,
+    ):
         """
         Extract data from HTML pages stored in an archive and saves it as a
         CSV file.
+
+        With several workers, batches of pages from the same archive are
+        parsed in a process pool and parsed records are written to
+        self.extract_store as batches complete. This requires
+        self.harvest_store to have a 'pop_batches' method (see
+        ZipHarvestStore), and self.soup_parser to be picklable, e.g. a
+        module-level function.
+
+        :param int workers: number of worker processes
+        :param int batch_size: maximum number of pages parsed per task
         """
         logging.info("start extracting")
 
+        if workers > 1:
+            self._extract_parallel(workers, batch_size)
+            logging.info("finished extracting")
+            return
+
         while len(self.harvest_store) > 0:
             file_name, content = self.harvest_store.get()
             logging.info(f"parsing {file_name}")
-            soup = self.html_parser(content)
+            soup = self.extract_parser(content)
             parsed = self.soup_parser(soup)
             inserted_rows = self.extract_store.write(parsed)
             logging.info(f"inserted {inserted_rows}")
 
         logging.info("finished extracting")
+
+    def _extract_parallel(self, workers, batch_size):
+        """
+        Parse pages of self.harvest_store in a process pool.
+
+        :param int workers: number of worker processes
+        :param int batch_size: maximum number of pages parsed per task
+        """
+        pending = set()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batches = self.harvest_store.pop_batches(batch_size)
+            for archive_path, file_names in batches:
+                logging.info(
+                    f"parsing {len(file_names)} files from {archive_path}"
+                )
+                pending.add(
+                    executor.submit(
+                        _extract_batch,
+                        archive_path,
+                        file_names,
+                        self.harvest_store.codec,
+                        self.extract_parser,
+                        self.soup_parser,
+                    )
+                )
+                # bound the number of batches held in memory
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._write_extracted(done)
+            self._write_extracted(pending)
+
+    def _write_extracted(self, futures):
+        """
+        Save the records parsed by extract worker processes.
+
+        :param iterable futures: futures returned by _extract_batch()
+        """
+        for future in futures:
+            inserted_rows = self.extract_store.write(future.result())
+            logging.info(f"inserted {inserted_rows}")
+
+    def pipeline(
+        self,
+        initial=None,
+        workers=cst.HARVEST_WORKERS,
+        max_pending=cst.PIPELINE_MAX_PENDING,
+    ):
+        """
+        Browse, harvest and extract in a single process.
+
+        Pages to harvest and harvested pages flow between stages through
+        bounded in-memory queues: when a downstream stage falls behind,
+        upstream stages block until it catches up. A page is extracted as
+        soon as it is downloaded, and it is also saved in self.harvest_store
+        if a harvest store is set.
+
+        Pages which fail to download are pushed to self.harvest_queue, so they
+        can be retried later with harvest().
+
+        :param str initial: URL where to start browsing (suffix to append
+            to the base URL)
+        :param int workers: number of concurrent download workers, the
+            download manager must be thread-safe, see harvest()
+        :param int max_pending: maximum number of items waiting in each
+            in-memory queue
+        """
+        logging.info("start pipeline")
+
+        to_harvest = BoundedQueue(max_pending)
+        to_extract = BoundedQueue(max_pending)
+        scheduler = TokenBucketScheduler(
+            self.base_url,
+            self.download_manager.request_delay,
+        )
+
+        def stop_on_error(future):
+            # stop the other stages instead of blocking on full queues
+            if future.exception() is not None:
+                logging.error(f"pipeline worker failed: {future.exception()}")
+                to_harvest.close()
+                to_extract.close()
+
+        with ThreadPoolExecutor(max_workers=workers + 1) as executor:
+            extractor = executor.submit(self._extract_worker, to_extract)
+            harvesters = [
+                executor.submit(
+                    self._pipeline_harvest_worker,
+                    to_harvest,
+                    to_extract,
+                    scheduler,
+                )
+                for _ in range(workers)
+            ]
+            for future in harvesters + [extractor]:
+                future.add_done_callback(stop_on_error)
+            try:
+                self.browse(initial, to_harvest, scheduler)
+            finally:
+                # None tells workers there is nothing left to process, a
+                # closed queue stops them too
+                try:
+                    for _ in range(workers):
+                        to_harvest.enqueue(None)
+                except RuntimeError:
+                    pass
+                wait(harvesters)
+                try:
+                    to_extract.enqueue(None)
+                except RuntimeError:
+                    pass
+                wait([extractor])
+                # keep pages which were not harvested to harvest them later
+                for url in to_harvest.drain():
+                    if url is not None:
+                        self.harvest_queue.enqueue(url)
+                for future in harvesters + [extractor]:
+                    future.result()
+
+        self.flush_queues()
+        logging.info("finished pipeline")
+
+    def _pipeline_harvest_worker(self, to_harvest, to_extract, scheduler):
+        """
+        Download pages from 'to_harvest' and pass them to 'to_extract', until
+        None is received.
+
+        :param BoundedQueue to_harvest: queue of pages to harvest
+        :param BoundedQueue to_extract: queue of (URL, content) to extract
+        :param TokenBucketScheduler scheduler: politeness scheduler shared
+            by all workers
+        """
+        while True:
+            current = to_harvest.dequeue()
+            if current is None:
+                return
+
+            try:
+                if not self._cached(current):
+                    scheduler.wait(current)
+                logging.info(f"downloading {cut_url(current)}")
+                content = self.download_manager.download_page(url=current)
+            except Exception:
+                logging.exception(f"failed to download {cut_url(current)}")
+                content = None
+
+            # if download failed, keep URL to harvest later
+            if content is None:
+                self.harvest_queue.enqueue(current)
+                continue
+
+            # if download is forbidden or page did not change, skip
+            if content in (cst.FORBIDDEN, cst.NOT_MODIFIED):
+                continue
+
+            try:
+                if self.harvest_store is not None:
+                    self._store(current, content)
+            except Exception:
+                logging.exception(f"failed to store {cut_url(current)}")
+
+            to_extract.enqueue((current, content))
+
+    def _extract_worker(self, to_extract):
+        """
+        Parse pages from 'to_extract' and save the data, until None is
+        received.
+
+        :param BoundedQueue to_extract: queue of (URL, content) to extract
+        """
+        while True:
+            item = to_extract.dequeue()
+            if item is None:
+                return
+
+            url, content = item
+            logging.info(f"parsing {cut_url(url)}")
+            try:
+                soup = self.extract_parser(content)
+                parsed = self.soup_parser(soup)
+                inserted_rows = self.extract_store.write(parsed)
+                logging.info(f"inserted {inserted_rows}")
+                # without a harvest store, the page is only kept as
+                # extracted data, it must be downloaded again if this failed
+                if self.harvest_store is None:
+                    self._save_validators(url)
+            except Exception:
+                logging.exception(f"failed to extract {cut_url(url)}")
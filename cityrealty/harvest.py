@@ -7,6 +7,7 @@ sys.path.insert(0, os.path.join(str(Path.home()), "real-estate-scraping"))
 
 from cityrealty.browse import get_listing_id
 from selenium_browser import Browser
+from selenium_utils import ResourceFilter
 
 
 def main():
@@ -15,6 +16,7 @@ def main():
         get_page_id=get_listing_id,
         config_file="cityrealty.conf",
         check_can_fetch=False,
+        resource_filter=ResourceFilter.for_site("https://www.cityrealty.com"),
     )
     crawler.harvest()
     crawler.close()
@@ -1,13 +1,22 @@
 import dateutil
-import functools
 import logging
-import math
 import re
 import sys
 
 sys.path.insert(0, "/home/jonathans/real-estate-scraping")
 
 from neighborhood_burrough_mapping import NEIGHBORHOOD_BURROUGH_MAPPING
+from parse_plan import (
+    Extractor,
+    field,
+    find,
+    find_all,
+    parse_region,
+    region,
+    select,
+    text,
+)
+from parsing_utils import safety_net, string_to_float, string_to_int, to_null
 
 from datetime import datetime
 from urllib.parse import urlparse
@@ -18,75 +27,6 @@ logging.basicConfig(
 )
 
 
-def safety_net(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except Exception:
-            logging.error(f"html tag parsing failed with '{func.__name__}'")
-    return wrapper
-
-
-def string_to_float(string):
-    """
-    Convert a string representing a number to a float.
-
-    :param str string: string to convert
-    :return float:
-    """
-    remap = {
-        ord(","): None,
-        ord("$"): None,
-        ord("\xa0"): None,
-    }
-    clean = string.translate(remap)
-    try:
-        return float(clean)
-    except ValueError:
-        return float("nan")
-
-
-def string_to_int(string):
-    """
-    Convert a string representing a number to a int.
-    Return 'NaN' if the string can't be converted to an integer.
-
-    :param str string: string to convert
-    :return int|nan:
-    """
-    remap = {
-        ord(","): None,
-        ord("$"): None,
-        ord("\xa0"): None,
-    }
-    clean = string.translate(remap)
-    try:
-        return int(clean)
-    except ValueError:
-        return float("nan")
-
-
-def to_null(d):
-    """
-    Convert the NaN (not a number) or empty values of a dictionary to the
-    string 'NULL'.
-
-    :param dict d: dictionary to convert
-    :return dict: dictionary where NaN and empty values are 'NULL'
-    """
-    for key, value in d.items():
-        if isinstance(value, float):
-            if math.isnan(value):
-                d[key] = "NULL"
-        elif isinstance(value, str):
-            if not value:
-                d[key] = "NULL"
-        elif value is None:
-            d[key] = "NULL"
-    return d
-
-
 @safety_net
 def get_rent_price(soup):
     """
@@ -389,3 +329,146 @@ def parse_webpage(soup):
     results["agency"] = get_agency_url(soup)
     results = to_null(results)
     return results
+
+
+# selectors of the tags the fields are extracted from
+PRICE = select("span", {"class": "price"})
+MAP_SIGNS = select("i", {"class": "fa fa-map-signs"})
+TITLE = select("h1", {"class": "bld_title"})
+CONTACT = select("div", {"class": "contact-wrapper"})
+WEBSITE = select("a", {"class": "website_link"})
+DESCRIPTION = select("div", {"class": "wysiwyg"})
+AMENITIES = select("div", {"class": "amenities section"})
+FEATURES = select("div", {"class": "building_features closed"})
+LISTED = select("div", {"class": "_content _listed"})
+BEDS_BATHS = select("span", {"class": "beds_baths"})
+BUILDING = select("div", {"class": "lst_info section building_info"})
+SPANS = select("span", many=True)
+
+
+def neighborhood_from_icon(icon):
+    sibling = icon.getparent().getnext()
+    if sibling.tag == "span":
+        return text(find(sibling, "a")).strip()
+
+
+def burrough_from_icon(icon):
+    neighborhood = neighborhood_from_icon(icon).lower()
+    return NEIGHBORHOOD_BURROUGH_MAPPING.get(neighborhood, "NULL")
+
+
+def amenities_from_sections(amenities, features):
+    items = []
+    for section in (amenities, features):
+        if section is not None:
+            items += [text(li).strip() for li in find_all(section, "li")]
+    return ", ".join(items)
+
+
+def days_listed_from_div(div):
+    span = find(div, "span")
+    date_listed = dateutil.parser.parse(text(span).split("Listed")[1])
+    return (datetime.today() - date_listed).days + 1  # start at 1
+
+
+def year_built_from_section(section):
+    for li in find_all(section, "li"):
+        if text(li).startswith("Built in"):
+            return re.search(r"[12][890]\d\d", text(li)).group(0)
+
+
+def search_beds_baths(pattern, group=1):
+    """
+    Make a post-processor which searches the beds and baths tag.
+
+    :param str pattern: regular expression
+    :param int group: group of the match to return
+    :return callable: post-processor
+    """
+    def process(span):
+        match = re.search(pattern, text(span))
+        if match:
+            return match.group(group)
+    return process
+
+
+def half_bathrooms_from_span(span):
+    match = re.search(r"\d+(\.5)? bath", text(span))
+    if match and match.group(1) == ".5":
+        return 1
+
+
+def rep_name_from_contact(div):
+    # like get_rep_name(), the name is missing from some listings
+    if div is not None:
+        name = find(div, "span", {"class": "name"})
+        if name is not None:
+            return text(name)
+
+
+def listing_type_from_spans(spans):
+    for span in spans:
+        if text(span) == "Building Type":
+            sibling = span.getnext()
+            if sibling is not None and sibling.tag == "span":
+                return text(sibling)
+
+
+SPEC = {
+    "listing_type": field(SPANS, listing_type_from_spans, str),
+    "property_type": field(),
+    "burrough": field(MAP_SIGNS, burrough_from_icon),
+    "neighborhood": field(MAP_SIGNS, neighborhood_from_icon),
+    "address": field(TITLE, type=str),
+    "zip": field(),
+    "price": field(PRICE, type=float),
+    "description": field(
+        DESCRIPTION, lambda div: text(div).replace("\n", " "), str
+    ),
+    "amenities": field((AMENITIES, FEATURES), amenities_from_sections),
+    "common_charges": field(),
+    "monthly_taxes": field(),
+    "days_listed": field(LISTED, days_listed_from_div),
+    "size": field(BEDS_BATHS, search_beds_baths(r"((\d,)?\d+)\sft"), int),
+    "year_built": field(BUILDING, year_built_from_section, int),
+    "bedrooms": field(BEDS_BATHS, search_beds_baths(r"(\d+)\+? bed"), int),
+    "bathrooms": field(
+        BEDS_BATHS, search_beds_baths(r"(\d+)(\.5)? bath"), int
+    ),
+    "half_bathrooms": field(BEDS_BATHS, half_bathrooms_from_span),
+    "rooms": field(),
+    "representative": field(CONTACT, rep_name_from_contact, str),
+    "agency": field(
+        WEBSITE, lambda a: urlparse(a.get("href")).netloc
+    ),
+}
+
+EXTRACTOR = Extractor(SPEC)
+
+# part of the pages containing the listing, the head and scripts are not
+# parsed
+REGION = region(start=b"<body")
+
+
+def parse_html(content):
+    """
+    Parse the part of a web page which contains the listing with lxml, to
+    use with parse_tree().
+
+    :param bytes|str content: HTML code
+    :return lxml.html.HtmlElement: root of the region's tree
+    """
+    return parse_region(content, REGION)
+
+
+def parse_tree(root):
+    """
+    Same as parse_webpage() but parses a page parsed with lxml (see
+    parse_html()), which is much faster: all tags are found in a
+    single traversal of the page.
+
+    :param lxml.html.HtmlElement root: root of the page's tree
+    :return dict: keys are home listing attributes and values are the
+                  corresponding values parsed from HTML
+    """
+    return EXTRACTOR.run(root)
@@ -6,8 +6,18 @@ CONFIG_DIR = os.path.join(str(Path.home()), ".browsing")
 DEFAULT_CONFIG = os.path.join(CONFIG_DIR, "browser.conf")
 HARVEST_FILE_REGEX = r"^harvest_[0-9]+\.bz2$"
 FORBIDDEN = "forbidden"
+NOT_MODIFIED = "not modified"
 ARCHIVE_PREFIX = "harvest_"
 MAX_ARCHIVE_SIZE = 100 * 1000 * 1000  # 100 MB
+HARVEST_CODEC = "bz2"
+ZSTD_LEVEL = 3
+ZSTD_DICT_SIZE = 110 * 1024  # 110 KB
+INDEX_COMMIT_EVERY = 1000
+ARCHIVE_FLUSH_EVERY = 100  # pages
+ARCHIVE_FLUSH_INTERVAL = 60  # seconds
+CACHE_TTL = 24 * 3600  # 1 day
+CACHE_MAX_SIZE = 1000 * 1000 * 1000  # 1 GB
+CACHE_COMMIT_EVERY = 100
 PAUSE_BACKOFF = 0.3
 PAUSE_MAX = 60 * 30  # 30 minutes
 GECKODRIVER_LOG = os.path.join(CONFIG_DIR, "geckodriver.log")
@@ -17,6 +27,15 @@ REQUEST_RETRY_ON = (500, 502, 503, 504)
 REQUEST_TIMEOUT = 3
 REQUEST_DELAY = 1
 MAX_TOR_REQUESTS = 50
+TOR_CIRCUITS = 4
+HARVEST_WORKERS = 1
+ASYNC_WORKERS = 100
+PIPELINE_MAX_PENDING = 100
+EXTRACT_WORKERS = 1
+EXTRACT_BATCH_SIZE = 100
+ASYNC_MAX_CONNECTIONS = 100
+ASYNC_MAX_CONNECTIONS_PER_HOST = 0  # no limit
+ASYNC_KEEPALIVE_TIMEOUT = 30
 FIREFOX_OPTIONS = [
     "headless",
     "window-size=1420,1080",
@@ -24,6 +43,9 @@ FIREFOX_OPTIONS = [
     "disable-plugins-discovery",
 ]
 WAIT_PAGE_LOAD = 20
+FIREFOX_POOL_SIZE = 1
+FIREFOX_MAX_PAGES = 100
+FIREFOX_PAGE_LOAD_TIMEOUT = 60
 
 # database constants
 SQLITE_ENGINE = "sqlite"
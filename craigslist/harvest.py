@@ -7,6 +7,7 @@ sys.path.insert(0, os.path.join(str(Path.home()), "real-estate-scraping"))
 
 from craigslist.browse import get_listing_id
 from selenium_browser import Browser
+from selenium_utils import ResourceFilter
 
 
 def main():
@@ -15,6 +16,11 @@ def main():
         get_page_id=get_listing_id,
         wait_page_load=10,
         config_file="craigslist.conf",
+        # listings are static HTML, no need for scripts
+        resource_filter=ResourceFilter.for_site(
+            "https://newyork.craigslist.org",
+            allow=(),
+        ),
     )
     crawler.harvest()
     crawler.close()
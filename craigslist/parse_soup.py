@@ -1,4 +1,3 @@
-import functools
 import logging
 import math
 import re
@@ -10,6 +9,17 @@ from string import punctuation
 sys.path.insert(0, "../")
 
 from neighborhood_burrough_mapping import NEIGHBORHOOD_BURROUGH_MAPPING
+from parse_plan import (
+    Extractor,
+    field,
+    find,
+    find_all,
+    parse_region,
+    region,
+    select,
+    text,
+)
+from parsing_utils import safety_net, string_to_float, string_to_int, to_null
 
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
@@ -20,79 +30,6 @@ BURROUGHS = {"bronx", "brooklyn", "new york", "queens", "staten island"}
 ZIP_REGEX = r"\s(1\d{4})[\s,$(]"
 
 
-def safety_net(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            logging.error(
-                f"html tag parsing failed with '{func.__name__}' "
-                f"with error: {e}"
-            )
-    return wrapper
-
-
-def clean_string(string):
-    """
-    Remove unwanted characters from strings (symbols, HTML characters, etc).
-
-    :param str string: string to clean
-    :returns: str - cleaned string
-    """
-    remap = {ord(c): None for c in ("$", ",", "\xa0")}
-    return string.translate(remap).strip()
-
-
-def string_to_float(string):
-    """
-    Convert a string representing a number to a float.
-
-    :param str string: string to convert
-    :return float:
-    """
-    clean = clean_string(string)
-    try:
-        return float(clean)
-    except ValueError:
-        return float("nan")
-
-
-def string_to_int(string):
-    """
-    Convert a string representing a number to a int.
-    Return 'NaN' if the string can't be converted to an integer.
-
-    :param str string: string to convert
-    :return int|nan:
-    """
-    clean = clean_string(string)
-    try:
-        return int(clean)
-    except ValueError:
-        return float("nan")
-
-
-def to_null(d):
-    """
-    Convert the NaN (not a number) or empty values of a dictionary to the
-    string 'NULL'.
-
-    :param dict d: dictionary to convert
-    :return dict: dictionary where NaN and empty values are 'NULL'
-    """
-    for key, value in d.items():
-        if isinstance(value, float):
-            if math.isnan(value):
-                d[key] = "NULL"
-        elif isinstance(value, str):
-            if not value:
-                d[key] = "NULL"
-        elif value is None:
-            d[key] = "NULL"
-    return d
-
-
 @safety_net
 def get_rent_price(soup):
     """
@@ -114,7 +51,17 @@ def get_location_from_title(soup):
     :return str: location name
     """
     title = soup.find("span", {"class": "postingtitletext"})
-    location = title.find("small").text.lower()
+    return clean_location(title.find("small").text)
+
+
+def clean_location(location):
+    """
+    Clean the location found in the rent title.
+
+    :param str location: location
+    :return str: location name
+    """
+    location = location.lower()
     location = location.replace("near ", "").strip()
     location = location.replace(" ny", "").strip()
     location = location.replace("prime ", "").strip()
@@ -155,10 +102,20 @@ def get_address(soup):
     """
     address = soup.find("div", {"class": "mapaddress"})
     if address is not None:
-        address = address.text.lower()
-        if " near " in address:
-            return address.split(" near ")[0]
-        return address
+        return clean_address(address.text)
+
+
+def clean_address(address):
+    """
+    Clean the street address of the map.
+
+    :param str address: street address
+    :return str: street address
+    """
+    address = address.lower()
+    if " near " in address:
+        return address.split(" near ")[0]
+    return address
 
 
 @safety_net
@@ -183,19 +140,22 @@ def get_zip(soup):
     :param soup: BeautifulSoup object
     :return str: zip code
     """
-    # try to parse zipcode from address
-    address = get_address(soup)
-    if address is not None:
-        zipcode = re.search(ZIP_REGEX, address)
-        if zipcode:
-            return zipcode.group(1)
+    return search_zip(get_address(soup), get_description(soup))
+
+
+def search_zip(address, description):
+    """
+    Search the zip code in the street address, then in the description.
 
-    # try to parse zipcode from description
-    description = get_description(soup)
-    if description is not None:
-        zipcode = re.search(ZIP_REGEX, description)
-        if zipcode:
-            return zipcode.group(1)
+    :param str address: street address
+    :param str description: home's description
+    :return str: zip code
+    """
+    for string in (address, description):
+        if string is not None:
+            zipcode = re.search(ZIP_REGEX, string)
+            if zipcode:
+                return zipcode.group(1)
 
 
 @safety_net
@@ -231,7 +191,16 @@ def get_agency_url(soup):
     :return str: agency's URL
     """
     # try to get agency URL from description
-    description = get_description(soup)
+    return search_website(get_description(soup))
+
+
+def search_website(description):
+    """
+    Search the agency's website in the description.
+
+    :param str description: home's description
+    :return str: agency's URL
+    """
     website = re.search(r"www\..*\.(com|net)", description)
     if website:
         return website.group(0)
@@ -259,9 +228,21 @@ def get_description(soup):
     :param soup: BeautifulSoup object
     :return str: home's description
     """
-    description = soup.find("section", {"id": "postingbody"}).text.strip()
+    description = soup.find("section", {"id": "postingbody"}).text
+    return clean_description(description, *get_coordinates(soup))
+
+
+def clean_description(description, lat, lon):
+    """
+    Clean the home's description and add the coordinates of the map.
 
+    :param str description: home's description
+    :param float lat: latitude
+    :param float lon: longitude
+    :return str: home's description
+    """
     # remove unnecessary comments and characters
+    description = description.strip()
     description = description.replace("\n", " ").replace("\xa0", " ").strip()
     boilerplate = "qr code link to this post"
     if description.lower().startswith(boilerplate):
@@ -269,7 +250,6 @@ def get_description(soup):
 
     # add latitude and longitude from map
     # because the low quality of address impairs the geolocation step
-    lat, lon = get_coordinates(soup)
     if not math.isnan(lat) and not math.isnan(lon):
         description += f" lat:{lat};lon:{lon}"
 
@@ -456,3 +436,140 @@ def parse_webpage(soup):
     results["agency"] = get_agency_url(soup)
     results = to_null(results)
     return results
+
+
+# selectors of the tags the fields are extracted from
+PRICE = select("span", {"class": "price"})
+TITLE = select("span", {"class": "postingtitletext"})
+MAP_ADDRESS = select("div", {"class": "mapaddress"})
+MAP = select("div", {"id": "map"})
+BODY = select("section", {"id": "postingbody"})
+ATTRIBUTES = select("p", {"class": "attrgroup"}, many=True)
+POSTED = select("time", {"class": "date timeago"})
+
+
+def location_from_title(title):
+    return clean_location(text(find(title, "small")))
+
+
+def neighborhood_from_title(title):
+    location = location_from_title(title)
+    if location not in BURROUGHS:
+        return location.title()
+
+
+def burrough_from_title(title):
+    location = location_from_title(title)
+    if location in BURROUGHS:
+        return location.title()
+    return NEIGHBORHOOD_BURROUGH_MAPPING.get(location.lower(), "NULL")
+
+
+def address_from_div(div):
+    if div is not None:
+        return clean_address(text(div))
+
+
+@safety_net
+def description_from_body(body, map_):
+    lat = string_to_float(map_.get("data-latitude"))
+    lon = string_to_float(map_.get("data-longitude"))
+    return clean_description(text(body), lat, lon)
+
+
+def zip_from_tags(address, body, map_):
+    return search_zip(
+        address_from_div(address),
+        description_from_body(body, map_),
+    )
+
+
+def amenities_from_attributes(attributes):
+    return ", ".join(text(span) for span in find_all(attributes[-1], "span"))
+
+
+def days_listed_from_time(time):
+    date = datetime.strptime(time.get("datetime").split("T")[0], "%Y-%m-%d")
+    return (datetime.today() - date).days
+
+
+def search_attributes(pattern):
+    """
+    Make a post-processor which searches the spans of the first attributes
+    group.
+
+    :param str pattern: regular expression, its first group is returned
+    :return callable: post-processor
+    """
+    def process(attributes):
+        for span in find_all(attributes[0], "span"):
+            match = re.search(pattern, text(span))
+            if match:
+                return match.group(1)
+    return process
+
+
+def half_bathrooms_from_attributes(attributes):
+    for span in find_all(attributes[0], "span"):
+        match = re.search(r"(\d+)(\.5)?([Bb][Aa])", text(span))
+        if match and match.group(2):
+            return 1
+    return 0
+
+
+SPEC = {
+    "listing_type": field(),
+    "property_type": field(),
+    "burrough": field(TITLE, burrough_from_title),
+    "neighborhood": field(TITLE, neighborhood_from_title),
+    "address": field(MAP_ADDRESS, address_from_div),
+    "zip": field((MAP_ADDRESS, BODY, MAP), zip_from_tags),
+    "price": field(PRICE, type=float),
+    "description": field((BODY, MAP), description_from_body),
+    "amenities": field(ATTRIBUTES, amenities_from_attributes),
+    "common_charges": field(),
+    "monthly_taxes": field(),
+    "days_listed": field(POSTED, days_listed_from_time),
+    "size": field(ATTRIBUTES, search_attributes(r"((\d+,)?\d+)ft2"), int),
+    "year_built": field(),
+    "bedrooms": field(ATTRIBUTES, search_attributes(r"(\d+)([Bb][Rr])"), int),
+    "bathrooms": field(
+        ATTRIBUTES, search_attributes(r"(\d+)(\.5)?([Bb][Aa])"), int
+    ),
+    "half_bathrooms": field(ATTRIBUTES, half_bathrooms_from_attributes),
+    "rooms": field(),
+    "representative": field(),
+    "agency": field((BODY, MAP), lambda body, map_: search_website(
+        description_from_body(body, map_)
+    )),
+}
+
+EXTRACTOR = Extractor(SPEC)
+
+# part of the pages containing the posting, the header, the head and
+# scripts are not parsed
+REGION = region(start=b'<section class="body"')
+
+
+def parse_html(content):
+    """
+    Parse the part of a web page which contains the listing with lxml, to
+    use with parse_tree().
+
+    :param bytes|str content: HTML code
+    :return lxml.html.HtmlElement: root of the region's tree
+    """
+    return parse_region(content, REGION)
+
+
+def parse_tree(root):
+    """
+    Same as parse_webpage() but parses a page parsed with lxml (see
+    parse_html()), which is much faster: all tags are found in a
+    single traversal of the page.
+
+    :param lxml.html.HtmlElement root: root of the page's tree
+    :return dict: keys are home listing attributes and values are the
+                  corresponding values parsed from HTML
+    """
+    return EXTRACTOR.run(root)
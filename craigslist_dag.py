@@ -56,7 +56,8 @@ def wait_queue_empty():
 def extract(**context):
     crawler = Browser(
         base_url=BASE_URL,
-        soup_parser=craigslist.parse_soup.parse_webpage,
+        soup_parser=craigslist.parse_soup.parse_tree,
+        extract_parser=craigslist.parse_soup.parse_html,
         harvest_date=context["ds_nodash"],
         wait_page_load=10,
         config_file=CONFIG_FILE,
@@ -1,30 +1,100 @@
+import asyncio
+import hashlib
 import logging
+import mmap
 import os
+import queue
 import random
+import sqlite3
+import threading
 import time
 
 import requests
 
+from collections import OrderedDict
+from functools import lru_cache
 from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 from requests.packages.urllib3.util.retry import Retry
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
 from stem.util.log import get_logger
 from urllib.parse import urljoin, urlparse
 
 import constants as cst
 
-from tor import TorSession
-from utils import cut_url, RobotParser, timeout
+from tor import TorCircuitPool
+from utils import cut_url, normalize_url, RobotParser
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 # silence stem log messages
 stem_logger = get_logger()
 stem_logger.propagate = False
 
 
+def request_headers(headers, validators, url):
+    """
+    Add the headers of a conditional request to request headers.
+
+    :param dict headers: request headers
+    :param ValidatorStore validators: validators of downloaded pages, if
+        None no headers are added
+    :param str url: URL to download
+    :return dict: request headers
+    """
+    if validators is None:
+        return headers
+    return {**(headers or {}), **validators.request_headers(url)}
+
+
+def check_modified(validators, url, response, content=None):
+    """
+    Return the contents of a downloaded web page, or cst.NOT_MODIFIED if it
+    did not change since it was last downloaded.
+
+    :param ValidatorStore validators: validators of downloaded pages, if
+        None the contents are always returned
+    :param str url: URL of the web page
+    :param response: HTTP response from 'requests' or 'aiohttp'
+    :param bytes content: contents of the web page, by default
+        response.content
+    :return bytes|str: contents of the web page or cst.NOT_MODIFIED
+    """
+    if content is None:
+        content = response.content
+    if validators is None:
+        return content
+    status = getattr(response, "status_code", None) or response.status
+    if not validators.check(url, status, response.headers, content):
+        logging.info(f"not modified {cut_url(url)}")
+        return cst.NOT_MODIFIED
+    return content
+
+
 class SimpleDownloadManager:
     """
     Simply uses the 'requests' Python library to download web pages.
+
+    With a ValidatorStore, pages are downloaded with conditional requests
+    and cst.NOT_MODIFIED is returned instead of the page contents if the
+    page did not change since it was last downloaded, unless download_page()
+    is called with conditional=False. New validators are saved by the
+    caller with ValidatorStore.save() once the page is processed.
+
+    It can be shared by threads: each thread downloads with its own
+    session.
     """
     def __init__(
         self,
@@ -36,6 +106,7 @@ class SimpleDownloadManager:
         proxies=None,
         timeout=cst.REQUEST_TIMEOUT,
         request_delay=cst.REQUEST_DELAY,
+        validators=None,
     ):
         self.base_url = base_url
         self.max_retries = max_retries
@@ -48,7 +119,9 @@ class SimpleDownloadManager:
             self.user_agent = None
         self.proxies = proxies
         self.timeout = timeout
-        self.session = self.get_session()
+        self.validators = validators
+        # requests sessions are not thread-safe, see session
+        self.local = threading.local()
 
         self.robot_parser = RobotParser(self.base_url, self.user_agent)
         self.request_delay = request_delay or self.robot_parser.request_delay
@@ -56,7 +129,7 @@ class SimpleDownloadManager:
         logging.info(f"using proxies: {self.proxies}")
         logging.info(f"using headers: {self.headers}")
 
-    def download_page(self, url):
+    def download_page(self, url, conditional=True):
         if not url.startswith(self.base_url):
             url = urljoin(self.base_url, url)
 
@@ -64,18 +137,29 @@ class SimpleDownloadManager:
             logging.info("forbidden to browse the current page")
             return cst.FORBIDDEN
 
+        validators = self.validators if conditional else None
         try:
             response = self.session.get(
                 url,
-                headers=self.headers,
+                headers=request_headers(self.headers, validators, url),
                 proxies=self.proxies,
                 timeout=self.timeout,
             )
-            return response.content
+            return check_modified(validators, url, response)
 
         except RequestException:
             logging.error(f"failed to download {cut_url(url)}")
 
+    @property
+    def session(self):
+        """
+        Session of the current thread, created on first use.
+        """
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.get_session()
+        return session
+
     def get_session(self):
         session = requests.Session()
 
@@ -96,9 +180,131 @@ class SimpleDownloadManager:
         time.sleep(self.request_delay)
 
 
+class AsyncDownloadManager:
+    """
+    Uses the 'aiohttp' Python library to download web pages from an asyncio
+    event loop. Connections are pooled and kept alive between requests, and
+    the number of requests in flight is bounded.
+
+    Like SimpleDownloadManager, sends conditional requests if given a
+    ValidatorStore.
+
+    This requires the 'aiohttp' package.
+    """
+    def __init__(
+        self,
+        base_url,
+        max_retries=cst.REQUEST_MAX_RETRIES,
+        backoff_factor=cst.REQUEST_BACKOFF_FACTOR,
+        retry_on=cst.REQUEST_RETRY_ON,
+        headers=None,
+        proxies=None,
+        timeout=cst.REQUEST_TIMEOUT,
+        request_delay=cst.REQUEST_DELAY,
+        max_connections=cst.ASYNC_MAX_CONNECTIONS,
+        max_connections_per_host=cst.ASYNC_MAX_CONNECTIONS_PER_HOST,
+        keepalive_timeout=cst.ASYNC_KEEPALIVE_TIMEOUT,
+        validators=None,
+    ):
+        if aiohttp is None:
+            raise ImportError("AsyncDownloadManager requires 'aiohttp'")
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retry_on = retry_on
+        self.headers = headers
+        if self.headers:
+            self.user_agent = self.headers.get("User-Agent")
+        else:
+            self.user_agent = None
+        self.proxies = proxies or {}
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.validators = validators
+        # the session and semaphore are bound to the running event loop,
+        # they are created on first download
+        self.session = None
+        self.semaphore = None
+
+        self.robot_parser = RobotParser(self.base_url, self.user_agent)
+        self.request_delay = request_delay or self.robot_parser.request_delay
+
+        logging.info(f"using proxies: {self.proxies}")
+        logging.info(f"using headers: {self.headers}")
+
+    async def download_page(self, url, conditional=True):
+        if not url.startswith(self.base_url):
+            url = urljoin(self.base_url, url)
+
+        if not self.robot_parser.can_fetch(url):
+            logging.info("forbidden to browse the current page")
+            return cst.FORBIDDEN
+
+        if self.session is None:
+            self.session = self.get_session()
+            self.semaphore = asyncio.Semaphore(self.max_connections)
+
+        proxy = self.proxies.get(urlparse(url).scheme)
+        validators = self.validators if conditional else None
+        headers = request_headers(None, validators, url)
+        async with self.semaphore:
+            for i in range(self.max_retries + 1):
+                try:
+                    async with self.session.get(
+                        url,
+                        proxy=proxy,
+                        headers=headers,
+                    ) as response:
+                        if response.status not in self.retry_on:
+                            content = await response.read()
+                            return check_modified(
+                                validators,
+                                url,
+                                response,
+                                content,
+                            )
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                if i < self.max_retries:
+                    await asyncio.sleep(self.backoff_factor * 2 ** i)
+
+        logging.error(f"failed to download {cut_url(url)}")
+
+    def get_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=self.timeout,
+                sock_read=self.timeout,
+            ),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def sleep(self):
+        await asyncio.sleep(self.request_delay)
+
+
 class TorDownloadManager:
     """
     Download web pages using Tor.
+
+    Downloads borrow a circuit from a pool of 'circuits' Tor circuits (see
+    tor.TorCircuitPool), so concurrent workers use different circuits and
+    circuits get a new identity in the background after 'max_requests'
+    requests. It can be shared by threads, which wait for a circuit when
+    there are more threads than circuits.
     """
     def __init__(
         self,
@@ -112,6 +318,8 @@ class TorDownloadManager:
         request_delay=cst.REQUEST_DELAY,
         max_requests=cst.MAX_TOR_REQUESTS,
         tor_password=None,
+        validators=None,
+        circuits=cst.TOR_CIRCUITS,
     ):
         self.base_url = base_url
         self.max_retries = max_retries
@@ -126,7 +334,9 @@ class TorDownloadManager:
         self.timeout = timeout
         self.max_requests = max_requests
         self.tor_password = tor_password or os.getenv("TOR_PASSWORD")
-        self.session = self.get_session()
+        self.validators = validators
+        self.circuits = circuits
+        self.pool = self.get_pool()
 
         self.robot_parser = RobotParser(self.base_url, self.user_agent)
         self.request_delay = request_delay or self.robot_parser.request_delay
@@ -134,15 +344,10 @@ class TorDownloadManager:
         logging.info(f"using proxies: {self.proxies}")
         logging.info(f"using proxies: {self.headers}")
 
-    def download_page(self, url):
-        if self.max_requests != 0 and self.n_requests == self.max_requests:
-            logging.info(
-                "reached max number of requests for single session, "
-                "getting new session"
-            )
-            self.session = self.get_session()
-        self.n_requests += 1
+    def close(self):
+        self.pool.close()
 
+    def download_page(self, url, conditional=True):
         if not url.startswith(self.base_url):
             url = urljoin(self.base_url, url)
 
@@ -150,27 +355,23 @@ class TorDownloadManager:
             logging.info("forbidden to browse the current page")
             return cst.FORBIDDEN
 
+        validators = self.validators if conditional else None
         try:
-            response = self.session.get(
-                url,
-                headers=self.headers,
-                proxies=self.proxies,
-                timeout=self.timeout,
-            )
-            return response.content
+            headers = request_headers(self.headers, validators, url)
+            with self.pool.circuit() as session:
+                response = session.get(
+                    url,
+                    headers=headers,
+                    proxies=self.proxies,
+                    timeout=self.timeout,
+                )
+            return check_modified(validators, url, response)
 
         except RequestException:
             logging.error(f"failed to download {cut_url(url)}")
 
-    def get_session(self):
-        self.n_requests = 0
-        # new IP only after reset_identity() is called and new session is made
-        logging.info("making a Tor session")
-        session = TorSession(password=self.tor_password)
-        session.reset_identity()
-        session = TorSession(password=self.tor_password)
-        logging.info("made a Tor session")
-
+    def get_pool(self):
+        logging.info("making a pool of Tor circuits")
         retry = Retry(
             total=self.max_retries,
             read=self.max_retries,
@@ -179,10 +380,17 @@ class TorDownloadManager:
             status_forcelist=self.retry_on,
         )
 
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        return session
+        def configure(session):
+            adapter = HTTPAdapter(max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+        return TorCircuitPool(
+            size=self.circuits,
+            password=self.tor_password,
+            max_requests=self.max_requests,
+            configure=configure,
+        )
 
     def sleep(self):
         time.sleep(self.request_delay)
@@ -192,11 +400,30 @@ class FirefoxDownloadManager:
     """
     Download web pages using the Python library selenium and the Firefox
     webdriver (geckodriver).
+
+    A pool of 'pool_size' drivers is started once and reused, so several
+    workers can download pages concurrently. A driver is replaced after
+    'max_pages' pages, or when it uses more than 'max_memory' bytes of
+    memory (this requires the 'psutil' package). If a new driver fails to
+    start, its slot stays in the pool and the driver is started again, with
+    backoff, by the next download which takes the slot. It can be shared by
+    threads, which wait for a driver when there are more threads than
+    drivers.
+
+    With a 'ready_selector', the page is returned as soon as an element
+    matching this CSS selector is present, or after 'wait_page_load'
+    seconds. Without it, the manager waits a random time around
+    'wait_page_load' seconds for the page to render.
+
+    With a 'resource_filter' (see selenium_utils.ResourceFilter), Firefox
+    does not download resources which are not needed to parse the page,
+    e.g. images, fonts, ads and analytics.
     """
     def __init__(
         self,
         base_url,
         max_retries=cst.REQUEST_MAX_RETRIES,
+        backoff_factor=cst.REQUEST_BACKOFF_FACTOR,
         wait_page_load=cst.WAIT_PAGE_LOAD,
         headers=None,
         proxies=None,
@@ -204,9 +431,16 @@ class FirefoxDownloadManager:
         options=cst.FIREFOX_OPTIONS,
         log_path=cst.GECKODRIVER_LOG,
         request_delay=cst.REQUEST_DELAY,
+        pool_size=cst.FIREFOX_POOL_SIZE,
+        ready_selector=None,
+        max_pages=cst.FIREFOX_MAX_PAGES,
+        max_memory=None,
+        page_load_timeout=cst.FIREFOX_PAGE_LOAD_TIMEOUT,
+        resource_filter=None,
     ):
         self.base_url = base_url
         self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
         self.wait_page_load = wait_page_load
         if headers:
             self.user_agent = headers.get("User-Agent")
@@ -216,7 +450,19 @@ class FirefoxDownloadManager:
         self.driver_path = driver_path
         self.options = options
         self.log_path = log_path
-        self.session = self.get_session()
+        self.ready_selector = ready_selector
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        if max_memory and psutil is None:
+            logging.warning("'psutil' is not installed, ignoring max_memory")
+        self.page_load_timeout = page_load_timeout
+        self.resource_filter = resource_filter
+
+        # start all drivers now so they are warm when downloading
+        self.pool = queue.Queue()
+        self.drivers = []
+        for _ in range(pool_size):
+            self._add_driver()
 
         self.robot_parser = RobotParser(self.base_url, self.user_agent)
         self.request_delay = request_delay or self.robot_parser.request_delay
@@ -225,13 +471,88 @@ class FirefoxDownloadManager:
         logging.info(f"using user agent: {self.user_agent}")
 
     def close(self):
-        self.session.close()
+        for driver in self.drivers:
+            driver.quit()
+        self.drivers = []
+
+    def _start_driver(self):
+        driver = self.get_session()
+        driver.set_page_load_timeout(self.page_load_timeout)
+        driver.pages = 0
+        self.drivers.append(driver)
+        return driver
+
+    def _add_driver(self):
+        self.pool.put(self._start_driver())
+
+    def _try_start_driver(self):
+        """
+        Start a driver, and log the error if it fails.
+
+        :return: selenium webdriver, or None if it failed to start
+        """
+        try:
+            return self._start_driver()
+        except Exception as e:
+            logging.error(f"{e}: failed to start Firefox driver")
+
+    def _replace_driver(self, driver):
+        """
+        Quit a driver and add a new one to the pool. If the new driver fails
+        to start, an empty slot (None) is added instead, so the pool does not
+        shrink.
+
+        :param driver: selenium webdriver to replace
+        """
+        logging.info(f"replacing Firefox driver after {driver.pages} pages")
+        self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"failed to quit Firefox driver: {e}")
+        self.pool.put(self._try_start_driver())
+
+    def _memory(self, driver):
+        """
+        Get the memory used by a driver, geckodriver and Firefox processes.
+
+        :param driver: selenium webdriver
+        :return int: resident set size in bytes
+        """
+        process = psutil.Process(driver.service.process.pid)
+        return sum(
+            p.memory_info().rss
+            for p in [process] + process.children(recursive=True)
+        )
 
-    @timeout(60)
-    def _get_page_contents(self, url):
-        self.session.get(url)
-        time.sleep(random.gauss(self.wait_page_load, self.wait_page_load / 6))
-        return self.session.page_source
+    def _worn_out(self, driver):
+        if self.max_pages and driver.pages >= self.max_pages:
+            return True
+        if self.max_memory and psutil is not None:
+            try:
+                return self._memory(driver) > self.max_memory
+            except (AttributeError, psutil.Error):
+                return False
+        return False
+
+    def _get_page_contents(self, driver, url):
+        driver.get(url)
+        if self.ready_selector:
+            try:
+                WebDriverWait(driver, self.wait_page_load).until(
+                    expected_conditions.presence_of_element_located(
+                        (By.CSS_SELECTOR, self.ready_selector)
+                    )
+                )
+            except TimeoutException:
+                logging.warning(
+                    f"'{self.ready_selector}' not found in {cut_url(url)}"
+                )
+        else:
+            time.sleep(
+                random.gauss(self.wait_page_load, self.wait_page_load / 6)
+            )
+        return driver.page_source
 
     def download_page(self, url):
         if not url.startswith(self.base_url):
@@ -242,23 +563,35 @@ class FirefoxDownloadManager:
             return cst.FORBIDDEN
 
         for i in range(self.max_retries):
+            driver = self.pool.get()
+            if driver is None:
+                # the driver of this slot failed to start, start it again
+                driver = self._try_start_driver()
+                if driver is None:
+                    self.pool.put(None)
+                    time.sleep(self.backoff_factor * 2 ** i)
+                    continue
             try:
-                return self._get_page_contents(url)
+                content = self._get_page_contents(driver, url)
             except Exception as e:
                 logging.error(
                     f"{e}: retry {i+1}/{self.max_retries} downloading "
                     f"{cut_url(url)} failed"
                 )
+                # the driver may be stuck loading the page
+                self._replace_driver(driver)
+                continue
+            driver.pages += 1
+            if self._worn_out(driver):
+                self._replace_driver(driver)
+            else:
+                self.pool.put(driver)
+            return content
         logging.error(f"too many retries downloading {cut_url(url)}")
 
     def get_session(self):
         https_proxy = urlparse(self.proxies.get("https")).netloc
         http_proxy = urlparse(self.proxies.get("http")).netloc or https_proxy
-        webdriver.DesiredCapabilities.FIREFOX["proxy"] = {
-            "httpProxy": http_proxy,
-            "sslProxy": https_proxy,
-            "proxyType": "MANUAL",
-        }
         options = webdriver.FirefoxOptions()
         for opt in self.options:
             options.add_argument(f"--{opt.lstrip('--')}")
@@ -268,6 +601,18 @@ class FirefoxDownloadManager:
                 "general.useragent.override",
                 self.user_agent
             )
+        if self.resource_filter and self.resource_filter.allowed_domains:
+            # the filter's PAC script routes requests through the proxy
+            webdriver.DesiredCapabilities.FIREFOX.pop("proxy", None)
+            self.resource_filter.apply(profile, https_proxy or None)
+        else:
+            webdriver.DesiredCapabilities.FIREFOX["proxy"] = {
+                "httpProxy": http_proxy,
+                "sslProxy": https_proxy,
+                "proxyType": "MANUAL",
+            }
+            if self.resource_filter:
+                self.resource_filter.apply(profile)
         session = webdriver.Firefox(
             executable_path=self.driver_path,
             options=options,
@@ -282,3 +627,267 @@ class FirefoxDownloadManager:
 
     def sleep(self):
         time.sleep(self.request_delay)
+
+
+@lru_cache(maxsize=100000)
+def cache_key(base_url, url):
+    """
+    Make the cache key of a web page.
+
+    :param str base_url: base URL of the website
+    :param str url: URL of the web page, relative to the base URL or absolute
+    :return str: hash of the normalized URL
+    """
+    if not url.startswith(base_url):
+        url = urljoin(base_url, url)
+    return hashlib.sha1(normalize_url(url).encode()).hexdigest()
+
+
+class CachedDownloadManager:
+    """
+    Wrap a download manager to cache downloaded web pages on disk, e.g. to
+    avoid downloading pages again when a failed run is restarted.
+
+    Pages are cached by normalized URL (see utils.normalize_url()) for 'ttl'
+    seconds, and the least recently used pages are evicted when the cache
+    grows over 'max_size' bytes. The cache index is kept in memory and saved
+    in a SQLite database in the cache directory, committed every
+    'commit_every' cached pages and by flush(), which Browser.flush_queues()
+    calls: after a crash, pages cached since the last commit are downloaded
+    again. get() returns a view of the memory-mapped page, without copying
+    it. Cache hits do not wait for the request delay: sleep() returns
+    right away after a hit, and callers which wait for a scheduler before
+    downloading can check cached() first.
+
+    The wrapped download manager may be asynchronous, e.g.
+    AsyncDownloadManager, in which case download_page() returns a coroutine.
+    Other attributes are those of the wrapped download manager.
+    """
+    def __init__(
+        self,
+        download_manager,
+        cache_dir,
+        ttl=cst.CACHE_TTL,
+        max_size=cst.CACHE_MAX_SIZE,
+        commit_every=cst.CACHE_COMMIT_EVERY,
+    ):
+        """
+        :param object download_manager: download manager to wrap
+        :param str cache_dir: directory where pages are cached
+        :param float ttl: time in seconds a cached page is used
+        :param int max_size: maximum size of cached pages in bytes
+        :param int commit_every: number of cached pages committed together
+            to the index
+        """
+        self.download_manager = download_manager
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.is_async = asyncio.iscoroutinefunction(
+            download_manager.download_page
+        )
+        self.lock = threading.Lock()
+        # whether the last page downloaded by each thread was cached
+        self.local = threading.local()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite"),
+            check_same_thread=False,
+            timeout=60,
+        )
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute("PRAGMA synchronous=NORMAL")
+        self.index.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        # key -> (size, stored_at), least recently used first
+        self.pages = OrderedDict(
+            (key, (size, stored_at))
+            for key, size, stored_at in self.index.execute(
+                "SELECT key, size, stored_at FROM pages ORDER BY accessed_at"
+            )
+        )
+        self.size = sum(size for size, _ in self.pages.values())
+        # access times not saved yet, key -> Unix timestamp
+        self.accessed = {}
+
+    def __getattr__(self, name):
+        return getattr(self.download_manager, name)
+
+    def _key(self, url):
+        return cache_key(self.download_manager.base_url, url)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def cached(self, url):
+        """
+        Check if a web page is in the cache and not expired.
+
+        :param str url: URL of the web page
+        :return bool:
+        """
+        with self.lock:
+            page = self.pages.get(self._key(url))
+        return page is not None and time.time() - page[1] <= self.ttl
+
+    def get(self, url):
+        """
+        Get a web page from the cache.
+
+        The page is not copied: the view is backed by the page's file mapped
+        in memory, and stays valid as long as it is referenced, even if the
+        page is cached again or evicted meanwhile, since cached files are
+        replaced or removed, never modified in place. The mapping is closed
+        once the view is garbage collected.
+
+        :param str url: URL of the web page
+        :return memoryview: contents of the page, or None if it is not
+            cached or expired
+        """
+        key = self._key(url)
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None:
+                return None
+            size, stored_at = page
+            if time.time() - stored_at > self.ttl:
+                self._evict(key)
+                return None
+            self.pages.move_to_end(key)
+            self.accessed[key] = time.time()
+        if size == 0:
+            return memoryview(b"")
+        try:
+            with open(self._path(key), "rb") as f:
+                return memoryview(
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                )
+        except FileNotFoundError:
+            with self.lock:
+                self._evict(key)
+            return None
+
+    def put(self, url, content):
+        """
+        Cache a web page, and evict the least recently used pages if the
+        cache is full.
+
+        :param str url: URL of the web page
+        :param bytes|str content: contents of the page
+        """
+        if isinstance(content, str):
+            content = content.encode()
+        key = self._key(url)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file so readers never see partial pages
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            if key in self.pages:
+                self.size -= self.pages.pop(key)[0]
+            self.pages[key] = (len(content), now)
+            self.size += len(content)
+            self.index.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                (key, len(content), now, now),
+            )
+            while self.size > self.max_size and len(self.pages) > 1:
+                self._evict(next(iter(self.pages)))
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self._commit()
+
+    def _evict(self, key):
+        """
+        Remove a page from the cache, the lock must be held.
+
+        :param str key: cache key of the page
+        """
+        size, _ = self.pages.pop(key)
+        self.size -= size
+        self.accessed.pop(key, None)
+        self.index.execute("DELETE FROM pages WHERE key = ?", (key,))
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def download_page(self, url, **kwargs):
+        """
+        :param str url: URL of the web page
+        :param kwargs: passed to the download_page() method of the wrapped
+            download manager on cache misses, e.g. 'conditional'
+        """
+        if self.is_async:
+            return self._download_page_async(url, **kwargs)
+
+        content = self.get(url)
+        self.local.hit = content is not None
+        if content is not None:
+            logging.info(f"cache hit {cut_url(url)}")
+            # parsers and harvest stores take bytes
+            return content.tobytes()
+
+        content = self.download_manager.download_page(url, **kwargs)
+        if self._cacheable(content):
+            self.put(url, content)
+        return content
+
+    async def _download_page_async(self, url, **kwargs):
+        content = self.get(url)
+        if content is not None:
+            logging.info(f"cache hit {cut_url(url)}")
+            return content.tobytes()
+
+        content = await self.download_manager.download_page(url, **kwargs)
+        if self._cacheable(content):
+            self.put(url, content)
+        return content
+
+    @staticmethod
+    def _cacheable(content):
+        # failed, forbidden and unchanged pages are not cached
+        return content is not None and content not in (
+            cst.FORBIDDEN,
+            cst.NOT_MODIFIED,
+        )
+
+    def sleep(self):
+        if not getattr(self.local, "hit", False):
+            return self.download_manager.sleep()
+
+    def _commit(self):
+        """
+        Save the access times of cached pages and commit the index, the lock
+        must be held.
+        """
+        self.index.executemany(
+            "UPDATE pages SET accessed_at = ? WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self.accessed.items()],
+        )
+        self.index.commit()
+        self.accessed = {}
+        self.uncommitted = 0
+
+    def flush(self):
+        """
+        Commit the index and save the access times of cached pages.
+        """
+        with self.lock:
+            self._commit()
@@ -0,0 +1,195 @@
+import bz2
+import gzip
+import lzma
+import threading
+
+from zipfile import ZIP_BZIP2, ZIP_DEFLATED, ZIP_LZMA
+
+import constants as cst
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+class Bz2Codec:
+    """
+    Compress web pages with bzip2. This is the historical codec of harvest
+    archives: it has a good compression ratio but is slow.
+    """
+    name = "bz2"
+    extension = ".bz2"
+    zip_compression = ZIP_BZIP2
+
+    def __init__(self, level=9):
+        self.level = level
+
+    def compress(self, data):
+        return bz2.compress(data, self.level)
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+
+class GzipCodec:
+    """
+    Compress web pages with gzip (deflate).
+    """
+    name = "gzip"
+    extension = ".gz"
+    zip_compression = ZIP_DEFLATED
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return gzip.compress(data, self.level)
+
+    def decompress(self, data):
+        return gzip.decompress(data)
+
+
+class LzmaCodec:
+    """
+    Compress web pages with LZMA (xz).
+    """
+    name = "lzma"
+    extension = ".xz"
+    zip_compression = ZIP_LZMA
+
+    def __init__(self, preset=6):
+        self.preset = preset
+
+    def compress(self, data):
+        return lzma.compress(data, preset=self.preset)
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+
+class ZstdCodec:
+    """
+    Compress web pages with Zstandard, optionally with a dictionary trained on
+    harvested pages (see train_zstd_dictionary()). A dictionary captures the
+    boilerplate repeated on every page of a website, which greatly improves
+    the compression of small pages.
+
+    Zip archives do not support Zstandard, pages are compressed by the codec
+    and stored uncompressed in the archive.
+    """
+    name = "zstd"
+    extension = ".zst"
+    zip_compression = None
+
+    def __init__(self, level=cst.ZSTD_LEVEL, dictionary=None):
+        """
+        :param int level: compression level
+        :param bytes|str dictionary: trained dictionary, or path to a file
+            containing it
+        """
+        if zstandard is None:
+            raise ImportError("the 'zstandard' package is required for zstd")
+        if isinstance(dictionary, str):
+            with open(dictionary, "rb") as f:
+                dictionary = f.read()
+        self.level = level
+        self.dictionary = dictionary
+        # zstandard (de)compressors must not be shared between threads
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def _get_local(self):
+        if not hasattr(self.local, "compressor"):
+            dict_data = None
+            if self.dictionary:
+                dict_data = zstandard.ZstdCompressionDict(self.dictionary)
+            self.local.compressor = zstandard.ZstdCompressor(
+                level=self.level,
+                dict_data=dict_data,
+            )
+            self.local.decompressor = zstandard.ZstdDecompressor(
+                dict_data=dict_data,
+            )
+        return self.local
+
+    def compress(self, data):
+        return self._get_local().compressor.compress(data)
+
+    def decompress(self, data):
+        return self._get_local().decompressor.decompress(data)
+
+
+class Lz4Codec:
+    """
+    Compress web pages with LZ4: lower compression ratio but very fast.
+
+    Zip archives do not support LZ4, pages are compressed by the codec and
+    stored uncompressed in the archive.
+    """
+    name = "lz4"
+    extension = ".lz4"
+    zip_compression = None
+
+    def __init__(self, level=0):
+        if lz4 is None:
+            raise ImportError("the 'lz4' package is required for lz4")
+        self.level = level
+
+    def compress(self, data):
+        return lz4.frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return lz4.frame.decompress(data)
+
+
+CODECS = {
+    codec.name: codec
+    for codec in (Bz2Codec, GzipCodec, LzmaCodec, ZstdCodec, Lz4Codec)
+}
+
+
+def get_codec(codec, **kwargs):
+    """
+    Return a codec object.
+
+    :param str|object codec: name of the codec, e.g. 'bz2', 'zstd', or a
+        codec object which is returned as is
+    :param kwargs: parameters passed to the codec class
+    :return object: codec with methods 'compress' and 'decompress' and
+        attributes 'name', 'extension' and 'zip_compression'
+    """
+    if not isinstance(codec, str):
+        return codec
+    if codec not in CODECS:
+        raise ValueError(
+            f"codec should be one of {list(CODECS)}, got: {codec}"
+        )
+    return CODECS[codec](**kwargs)
+
+
+def train_zstd_dictionary(samples, dict_size=cst.ZSTD_DICT_SIZE):
+    """
+    Train a Zstandard dictionary on harvested web pages.
+
+    :param list[bytes] samples: contents of web pages, a few hundreds pages
+        are usually enough
+    :param int dict_size: maximum size of the dictionary in bytes
+    :return bytes: dictionary to pass to ZstdCodec
+    """
+    if zstandard is None:
+        raise ImportError("the 'zstandard' package is required for zstd")
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
@@ -1,19 +1,39 @@
+import bz2
 import glob
 import os
+import sqlite3
+import struct
+import time
+import zlib
 
 from collections import deque
-from zipfile import ZipFile, ZIP_BZIP2
+from zipfile import ZipFile, ZIP_BZIP2, ZIP_DEFLATED, ZIP_STORED
 
 import constants as cst
 
+from harvest_codecs import get_codec
+from utils import page_digest
+
 
 class ZipHarvestStore:
     """
-    Stores harvested web pages as compressed bzip2 archives.
+    Stores harvested web pages as compressed zip archives, using bzip2 by
+    default (see harvest_codecs for other codecs).
     Archive size is capped.
     This class writes and reads compressed web pages, but does not delete them.
     If files that match the archive name prefix exist in the harvest directory
     when this class is instantiated, they will be added to this store.
+
+    By default, the archive is opened and closed for each web page stored.
+    With 'keep_open', the current archive stays open between calls to put()
+    and its central directory is written when the archive is full, when
+    reading from the store, when the store is closed, and every
+    'flush_every' pages or 'flush_interval' seconds. Pages stored since the
+    central directory was last written are lost if the process crashes, even
+    though put() returned, so with queues which acknowledge pages once
+    stored, lower values lose fewer pages but reopen the archive more often.
+    In this mode, the store should be closed after use, e.g. with a 'with'
+    statement.
     """
 
     def __init__(
@@ -21,26 +41,62 @@ class ZipHarvestStore:
         harvest_dir,
         archive_prefix=cst.ARCHIVE_PREFIX,
         max_archive_size=cst.MAX_ARCHIVE_SIZE,
+        keep_open=False,
+        codec=cst.HARVEST_CODEC,
+        flush_every=cst.ARCHIVE_FLUSH_EVERY,
+        flush_interval=cst.ARCHIVE_FLUSH_INTERVAL,
     ):
         self.harvest_dir = harvest_dir
         self.archive_prefix = archive_prefix
         self.max_archive_size = max_archive_size
+        self.keep_open = keep_open
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.codec = get_codec(codec)
+        self.extension = self.codec.extension
         self.archive_count = 1
         self.file_names = deque()
+        self.writer = None
+        self._load_archives()
 
-        glob_path = os.path.join(
-            self.harvest_dir,
-            f"{self.archive_prefix}*.bz2"
-        )
-        for path in glob.glob(glob_path):
-            with ZipFile(path, "r", compression=ZIP_BZIP2) as archive:
+    def _load_archives(self):
+        """
+        Add files from existing archives of the harvest directory to the
+        store.
+        """
+        for path in self._glob_archives():
+            with ZipFile(path, "r") as archive:
                 for name in archive.namelist():
                     self.file_names.appendleft((path, name))
             self.archive_count += 1
 
+    def _glob_archives(self):
+        """
+        :returns (list): paths of existing archives in the harvest directory
+        """
+        glob_path = os.path.join(
+            self.harvest_dir,
+            f"{self.archive_prefix}*{self.extension}"
+        )
+        return glob.glob(glob_path)
+
     def __len__(self):
         return len(self.file_names)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the archive kept open for writing, if any.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
     def _get_archive_name(self):
         """
         Returns the current archive's file name.
@@ -51,7 +107,8 @@ class ZipHarvestStore:
         :returns (str): archive file name
         """
         archive_name = os.path.join(
-            self.harvest_dir, f"{self.archive_prefix}{self.archive_count}.bz2"
+            self.harvest_dir,
+            f"{self.archive_prefix}{self.archive_count}{self.extension}"
         )
         while (
             os.path.exists(archive_name)
@@ -60,11 +117,11 @@ class ZipHarvestStore:
             self.archive_count += 1
             archive_name = os.path.join(
                 self.harvest_dir,
-                f"{self.archive_prefix}{self.archive_count}.bz2"
+                f"{self.archive_prefix}{self.archive_count}{self.extension}"
             )
         archive_name = os.path.join(
             self.harvest_dir,
-            f"{self.archive_prefix}{self.archive_count}.bz2"
+            f"{self.archive_prefix}{self.archive_count}{self.extension}"
         )
         return archive_name
 
@@ -76,18 +133,524 @@ class ZipHarvestStore:
             archive
         :param str data: HTML text of a harvested web page
         """
-        archive_name = self._get_archive_name()
-        with ZipFile(archive_name, "a", compression=ZIP_BZIP2) as archive:
-            archive.writestr(file_name, data)
+        archive_name, _ = self._put(file_name, data)
         self.file_names.appendleft((archive_name, file_name))
 
+    def _put(self, file_name, data):
+        """
+        Compress and write the data as a file in the current archive.
+
+        :param str file_name: name of the file that store the data in the
+            archive
+        :param str data: HTML text of a harvested web page
+        :returns (tuple): archive path and ZipInfo of the written file
+        """
+        if self.keep_open:
+            return self._put_open(file_name, data)
+
+        archive_name = self._get_archive_name()
+        with self._open_archive(archive_name) as archive:
+            info = self._write(archive, file_name, data)
+        return archive_name, info
+
+    def _open_archive(self, archive_name):
+        """
+        Open an archive for writing with the compression of the codec.
+
+        :param str archive_name: path to the archive
+        :returns (ZipFile): archive open in append mode
+        """
+        return ZipFile(
+            archive_name,
+            "a",
+            compression=self.codec.zip_compression or ZIP_STORED,
+        )
+
+    def _write(self, archive, file_name, data):
+        """
+        Compress and write the data as a file in an archive. If zip archives
+        do not support the codec, data is compressed by the codec and stored
+        uncompressed in the archive.
+
+        :param ZipFile archive: archive open for writing
+        :param str file_name: name of the file that store the data in the
+            archive
+        :param str|bytes data: HTML text of a harvested web page
+        :returns (ZipInfo): information about the written file
+        """
+        if self.codec.zip_compression is None:
+            if isinstance(data, str):
+                data = data.encode()
+            data = self.codec.compress(data)
+        archive.writestr(file_name, data)
+        return archive.infolist()[-1]
+
+    def _put_open(self, file_name, data):
+        """
+        Same as _put() but keeps the archive open for the next call.
+
+        :param str file_name: name of the file that store the data in the
+            archive
+        :param str data: HTML text of a harvested web page
+        :returns (tuple): archive path and ZipInfo of the written file
+        """
+        if self.writer is None:
+            self.writer = self._open_archive(self._get_archive_name())
+            self.opened_at = time.monotonic()
+            self.unflushed = 0
+        archive_name = self.writer.filename
+        info = self._write(self.writer, file_name, data)
+        self.unflushed += 1
+
+        # file data is written right away, only the central directory is
+        # written on close, so the file position is the archive size
+        if self.writer.fp.tell() > self.max_archive_size:
+            self.close()
+            self.archive_count += 1
+        elif (
+            self.unflushed >= self.flush_every
+            or time.monotonic() - self.opened_at >= self.flush_interval
+        ):
+            # write the central directory so the pages stored so far survive
+            # a crash, the archive is opened again by the next call
+            self.close()
+
+        return archive_name, info
+
     def get(self):
         """
         Decompress and return archived web page contents.
 
         :returns (str): archived web page contents
         """
+        self.close()
         archive_path, file_name = self.file_names.pop()
-        with ZipFile(archive_path, "r", compression=ZIP_BZIP2) as archive:
-            data = archive.read(file_name).decode()
+        [(_, data)] = read_archive(archive_path, [file_name], codec=self.codec)
         return file_name, data
+
+    def pop_batches(self, batch_size):
+        """
+        Pop archived files names in the order get() would return them, grouped
+        by archive.
+
+        :param int batch_size: maximum number of file names in a batch
+        :returns (generator): tuples (archive path, list of file names)
+        """
+        self.close()
+        batch = []
+        batch_archive = None
+        while self.file_names:
+            archive_path, file_name = self.file_names.pop()
+            if batch and (
+                archive_path != batch_archive or len(batch) == batch_size
+            ):
+                yield batch_archive, batch
+                batch = []
+            batch_archive = archive_path
+            batch.append(file_name)
+        if batch:
+            yield batch_archive, batch
+
+
+class IndexedZipHarvestStore(ZipHarvestStore):
+    """
+    Zip harvest store with a persistent index of stored web pages, kept in a
+    SQLite database next to the archives.
+
+    The index maps each page ID (the file name given to put()) to its
+    archive, the offset and size of its compressed data in the archive, and
+    its harvest time. It is updated on put(), so opening the store does not
+    list the contents of every archive, and a page can be read by ID without
+    reading the archive's central directory.
+
+    If the same page ID is stored several times, the index points to the
+    last version. Unlike ZipHarvestStore, pages returned by get() are
+    remembered in the index, so a reopened store resumes where it stopped.
+    Index changes are committed in batches and when the store is closed.
+
+    If the harvest directory has archives but no index, the index is built
+    from the archives when the store is opened.
+
+    With 'dedup', pages are identified by a hash of their normalized contents
+    (see utils.normalize_page()) and each unique page is written only once:
+    a page identical to an already stored page only adds a reference to it
+    in the index. A page which did not change since it was last stored is not
+    returned by get() again, so it is not extracted again.
+    """
+
+    def __init__(self, harvest_dir, dedup=False, digest=page_digest, **kwargs):
+        """
+        :param str harvest_dir: directory where archives are stored
+        :param bool dedup: store identical pages only once
+        :param callable digest: function which hashes web page contents
+        :param kwargs: parameters passed to ZipHarvestStore
+        """
+        self.dedup = dedup
+        self.digest = digest
+        super().__init__(harvest_dir, **kwargs)
+
+    def _load_archives(self):
+        """
+        Open the index, and build it from existing archives if it is empty.
+        """
+        self.index_path = os.path.join(
+            self.harvest_dir,
+            f"{self.archive_prefix}index.sqlite",
+        )
+        self.index = sqlite3.connect(
+            self.index_path,
+            check_same_thread=False,
+        )
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute("PRAGMA synchronous=NORMAL")
+        self.index.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                archive TEXT NOT NULL,
+                name TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                compression INTEGER NOT NULL,
+                harvested_at REAL NOT NULL,
+                digest TEXT
+            )
+            """
+        )
+        self.index.execute(
+            "CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest)"
+        )
+        self.index.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)"
+        )
+        self.uncommitted = 0
+        self.cursor = 0
+
+        meta = dict(self.index.execute("SELECT key, value FROM meta"))
+        if "archive_count" not in meta:
+            self._build_index()
+            meta = dict(self.index.execute("SELECT key, value FROM meta"))
+
+        # like ZipHarvestStore, start a new archive
+        self.archive_count = int(meta["archive_count"]) + 1
+        self.cursor = int(meta.get("cursor", 0))
+        self.pending = self.index.execute(
+            "SELECT COUNT(*) FROM pages WHERE rowid > ?",
+            (self.cursor,),
+        ).fetchone()[0]
+
+    def _build_index(self):
+        """
+        Add the files of existing archives to the index.
+        """
+        paths = self._glob_archives()
+        for path in paths:
+            with ZipFile(path, "r") as archive:
+                for info in archive.infolist():
+                    self._add_to_index(
+                        info.filename,
+                        os.path.basename(path),
+                        info.filename,
+                        info.header_offset,
+                        info.compress_size,
+                        info.compress_type,
+                        _zip_timestamp(info),
+                    )
+        self.archive_count = len(paths)
+        self._commit()
+
+    def __len__(self):
+        return self.pending
+
+    def close(self):
+        """
+        Close the archive kept open for writing, if any, and commit the
+        index.
+        """
+        super().close()
+        self._commit()
+
+    def _commit(self):
+        """
+        Save the reading position and the archive count, and commit the
+        index.
+        """
+        self.index.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            [
+                ("archive_count", self.archive_count),
+                ("cursor", self.cursor),
+            ],
+        )
+        self.index.commit()
+        self.uncommitted = 0
+
+    def _changed(self):
+        """
+        Count an index change and commit the index every
+        cst.INDEX_COMMIT_EVERY changes.
+        """
+        self.uncommitted += 1
+        if self.uncommitted >= cst.INDEX_COMMIT_EVERY:
+            self._commit()
+
+    def _add_to_index(
+        self,
+        page_id,
+        archive,
+        name,
+        offset,
+        size,
+        compression,
+        harvested_at,
+        digest=None,
+    ):
+        """
+        Add a page to the index, or update it if it is already indexed.
+
+        :param str page_id: name given to the page when stored
+        :param str archive: file name of the archive
+        :param str name: name of the file that store the page in the archive
+        :param int offset: offset of the file's local header in the archive
+        :param int size: size of the compressed file
+        :param int compression: zip compression method of the file
+        :param float harvested_at: harvest time as a Unix timestamp
+        :param str digest: hash of the page contents
+        """
+        self.index.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                page_id,
+                archive,
+                name,
+                offset,
+                size,
+                compression,
+                harvested_at,
+                digest,
+            ),
+        )
+
+    def put(self, file_name, data):
+        """
+        Compress and store the data as a file in the current archive, and
+        add it to the index.
+
+        :param str file_name: name of the file that store the data in the
+            archive
+        :param str data: HTML text of a harvested web page
+        """
+        row = self.index.execute(
+            "SELECT rowid, digest FROM pages WHERE page_id = ?",
+            (file_name,),
+        ).fetchone()
+
+        digest = None
+        location = None
+        if self.dedup:
+            digest = self.digest(data)
+            if row is not None and row[1] == digest:
+                # page did not change, it does not need to be extracted again
+                self.index.execute(
+                    "UPDATE pages SET harvested_at = ? WHERE page_id = ?",
+                    (time.time(), file_name),
+                )
+                self._changed()
+                return
+            location = self.index.execute(
+                "SELECT archive, name, offset, size, compression FROM pages "
+                "WHERE digest = ? LIMIT 1",
+                (digest,),
+            ).fetchone()
+
+        if location is None:
+            archive_name, info = self._put(file_name, data)
+            location = (
+                os.path.basename(archive_name),
+                info.filename,
+                info.header_offset,
+                info.compress_size,
+                info.compress_type,
+            )
+
+        # a page waiting to be read is replaced by its new version
+        if row is None or row[0] <= self.cursor:
+            self.pending += 1
+        self._add_to_index(file_name, *location, time.time(), digest)
+        self._changed()
+
+    def lookup(self, page_id):
+        """
+        Get the location of a web page from the index.
+
+        :param str page_id: name of the file that store the page
+        :returns (dict): archive path, offset and size of the compressed
+            data, and harvest time, or None if the page is not in the store
+        """
+        row = self.index.execute(
+            "SELECT archive, offset, size, harvested_at FROM pages "
+            "WHERE page_id = ?",
+            (page_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        archive, offset, size, harvested_at = row
+        return {
+            "archive": os.path.join(self.harvest_dir, archive),
+            "offset": offset,
+            "size": size,
+            "harvested_at": harvested_at,
+        }
+
+    def read(self, page_id):
+        """
+        Decompress and return a web page by ID, whether it was returned by
+        get() or not.
+
+        :param str page_id: name of the file that store the page
+        :returns (str): archived web page contents
+        """
+        row = self.index.execute(
+            "SELECT archive, name, offset, size, compression FROM pages "
+            "WHERE page_id = ?",
+            (page_id,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(page_id)
+        return self._read_row(row)
+
+    def _read_row(self, row):
+        """
+        Decompress the web page located by an index row.
+
+        :param tuple row: archive, name, offset, size, compression
+        :returns (str): archived web page contents
+        """
+        archive, name, offset, size, compression = row
+        path = os.path.join(self.harvest_dir, archive)
+        # data of the archive open for writing may still be buffered
+        if self.writer is not None and self.writer.filename == path:
+            self.writer.fp.flush()
+        data = read_at(path, name, offset, size, compression)
+        if self.codec.zip_compression is None:
+            data = self.codec.decompress(data)
+        return data.decode()
+
+    def get(self):
+        """
+        Decompress and return the next archived web page contents, in the
+        order they were stored.
+
+        :returns (str): archived web page contents
+        """
+        row = self.index.execute(
+            "SELECT rowid, page_id, archive, name, offset, size, compression "
+            "FROM pages WHERE rowid > ? ORDER BY rowid LIMIT 1",
+            (self.cursor,),
+        ).fetchone()
+        if row is None:
+            raise IndexError("get from an empty store")
+        self.cursor = row[0]
+        self.pending -= 1
+        self._changed()
+        return row[1], self._read_row(row[2:])
+
+    def pop_batches(self, batch_size):
+        """
+        Pop archived files names in the order get() would return them, grouped
+        by archive.
+
+        :param int batch_size: maximum number of file names in a batch
+        :returns (generator): tuples (archive path, list of file names)
+        """
+        super().close()
+        while True:
+            rows = self.index.execute(
+                "SELECT rowid, name, archive FROM pages WHERE rowid > ? "
+                "ORDER BY rowid LIMIT ?",
+                (self.cursor, batch_size),
+            ).fetchall()
+            if not rows:
+                self._commit()
+                return
+            batch = []
+            batch_archive = rows[0][2]
+            for rowid, name, archive in rows:
+                if archive != batch_archive:
+                    break
+                batch.append(name)
+                self.cursor = rowid
+            self.pending -= len(batch)
+            self._changed()
+            yield os.path.join(self.harvest_dir, batch_archive), batch
+
+
+def _zip_timestamp(info):
+    """
+    :param ZipInfo info: information about a file in a zip archive
+    :returns (float): modification time of the file as a Unix timestamp
+    """
+    return time.mktime(info.date_time + (0, 0, -1))
+
+
+def read_at(archive_path, file_name, offset, size, compression):
+    """
+    Read and decompress a file from a zip archive at a known position,
+    without reading the archive's central directory.
+
+    :param str archive_path: path to the archive
+    :param str file_name: name of the file in the archive
+    :param int offset: offset of the file's local header in the archive
+    :param int size: size of the compressed file
+    :param int compression: zip compression method of the file
+    :returns (bytes): file contents
+    """
+    if compression not in (ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2):
+        with ZipFile(archive_path, "r") as archive:
+            return archive.read(file_name)
+
+    with open(archive_path, "rb") as f:
+        f.seek(offset)
+        header = f.read(30)
+        # the local header is followed by the file name and an extra field
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        f.seek(name_length + extra_length, os.SEEK_CUR)
+        data = f.read(size)
+
+    if compression == ZIP_DEFLATED:
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+    if compression == ZIP_BZIP2:
+        return bz2.decompress(data)
+    return data
+
+
+def read_archive(archive_path, file_names, archives=None, codec=None):
+    """
+    Decompress and return several web pages from the same archive, opening
+    the archive only once.
+
+    :param str archive_path: path to the archive
+    :param list file_names: names of the files to read from the archive
+    :param dict archives: if given, cache of open archives keyed by path, the
+        archive is taken from and kept in this cache instead of being closed
+    :param object codec: codec the archive was written with, defaults to
+        bzip2
+    :returns (list): tuples (file name, web page contents)
+    """
+    codec = get_codec(codec or cst.HARVEST_CODEC)
+
+    def read(archive, file_name):
+        data = archive.read(file_name)
+        if codec.zip_compression is None:
+            data = codec.decompress(data)
+        return data.decode()
+
+    if archives is None:
+        with ZipFile(archive_path, "r") as archive:
+            return [(n, read(archive, n)) for n in file_names]
+
+    archive = archives.get(archive_path)
+    if archive is None:
+        archive = ZipFile(archive_path, "r")
+        archives[archive_path] = archive
+    return [(n, read(archive, n)) for n in file_names]
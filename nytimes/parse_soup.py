@@ -1,83 +1,27 @@
-import functools
 import logging
-import math
 import re
 
+from parse_plan import (
+    Extractor,
+    field,
+    find,
+    find_all,
+    next_sibling,
+    node_text,
+    nodes,
+    parse_region,
+    region,
+    select,
+    text,
+)
+from parsing_utils import safety_net, string_to_float, string_to_int, to_null
+
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
     level=logging.INFO,
 )
 
 
-def safety_net(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except Exception:
-            logging.error(f"html tag parsing failed with '{func.__name__}'")
-    return wrapper
-
-
-def string_to_float(string):
-    """
-    Convert a string representing a number to a float.
-
-    :param str string: string to convert
-    :return float:
-    """
-    remap = {
-        ord(","): None,
-        ord("$"): None,
-        ord("\xa0"): None,
-    }
-    clean = string.translate(remap)
-    try:
-        return float(clean)
-    except ValueError:
-        return float("nan")
-
-
-def string_to_int(string):
-    """
-    Convert a string representing a number to a int.
-    Return 'NaN' if the string can't be converted to an integer.
-
-    :param str string: string to convert
-    :return int|nan:
-    """
-    remap = {
-        ord(","): None,
-        ord("$"): None,
-        ord("\xa0"): None,
-    }
-    clean = string.translate(remap)
-    try:
-        return int(clean)
-    except ValueError:
-        return float("nan")
-
-
-def to_null(d):
-    """
-    Convert the NaN (not a number) or empty values of a dictionary to the
-    string 'NULL'.
-
-    :param dict d: dictionary to convert
-    :return dict: dictionary where NaN and empty values are 'NULL'
-    """
-    for key, value in d.items():
-        if isinstance(value, float):
-            if math.isnan(value):
-                d[key] = "NULL"
-        elif isinstance(value, str):
-            if not value:
-                d[key] = "NULL"
-        elif value is None:
-            d[key] = "NULL"
-    return d
-
-
 @safety_net
 def get_rent_price(soup):
     """
@@ -435,3 +379,157 @@ def parse_webpage(soup):
     results["agency"] = get_agency_url(soup)
     results = to_null(results)
     return results
+
+
+# selectors of the tags the fields are extracted from
+ASIDE = select("aside")
+ABOUT = select("h3")
+H3 = select("h3", many=True)
+AMENITIES = select("p", {"aria-label": True})
+
+
+def aside_span(index, process=text):
+    """
+    Make a post-processor which reads a span of the aside.
+
+    :param int index: index of the span
+    :param callable process: function which takes the span
+    :return callable: post-processor
+    """
+    def process_aside(aside):
+        return process(find_all(aside, "span")[index])
+    return process_aside
+
+
+def price_from_aside(aside):
+    for span in find_all(aside, "span"):
+        if text(span)[0] == "$":
+            return text(span)
+
+
+def zip_from_span(span):
+    match = re.search(r"\s([01]\d{4})", text(span))
+    if match:
+        return match.group(1)
+
+
+def representative_from_aside(process):
+    """
+    Make a post-processor which reads the node following the
+    representative's span.
+
+    :param callable process: function which takes the node
+    :return callable: post-processor
+    """
+    def process_aside(aside):
+        for span in find_all(aside, "span"):
+            if re.search("representative", text(span), re.IGNORECASE):
+                return process(next_sibling(span))
+    return process_aside
+
+
+def agency_from_info(info):
+    a = find(info, "a")
+    if a.get("href") is None:
+        return text(a)
+    return a.get("href")
+
+
+def description_from_about(about):
+    parent = about.getparent()
+    links = len(find_all(parent, "a"))
+    if links == 0:
+        return text(find_all(parent, "p")[0])
+    if links == 1:
+        return text(find_all(parent, "p")[2])
+
+
+def feature(label, startswith=False, process=None):
+    """
+    Make a post-processor which reads a feature following the second h3.
+
+    :param str label: lowercase label of the feature
+    :param bool startswith: match labels starting with 'label'
+    :param callable process: function which takes the feature's text
+    :return callable: post-processor
+    """
+    def process_features(h3s):
+        for f in next_sibling(h3s[1]):
+            name = text(find(f, "div")).lower()
+            if name == label or (startswith and name.startswith(label)):
+                value = text(find(f, "p"))
+                return process(value) if process else value
+    return process_features
+
+
+def days_listed_from_text(string):
+    string = string.split()[0].lower().strip()
+    if string == "today":
+        return 0
+    return string
+
+
+SPEC = {
+    "listing_type": field(H3, feature("property type"), str),
+    "property_type": field(
+        ASIDE, aside_span(4, lambda span: node_text(nodes(span)[-1]))
+    ),
+    "burrough": field(
+        ASIDE, aside_span(3, lambda span: text(span).split(",")[0]), str
+    ),
+    "neighborhood": field(ASIDE, aside_span(1), str),
+    "address": field(ASIDE, aside_span(2), str),
+    "zip": field(ASIDE, aside_span(3, zip_from_span)),
+    "price": field(ASIDE, price_from_aside, float),
+    "description": field(ABOUT, description_from_about),
+    "amenities": field(AMENITIES),
+    "common_charges": field(H3, feature("cc/maintenance"), float),
+    "monthly_taxes": field(H3, feature("monthly taxes"), float),
+    "days_listed": field(
+        H3, feature("listed", process=days_listed_from_text), int
+    ),
+    "size": field(
+        H3, feature("size", process=lambda s: s.split()[0]), int
+    ),
+    "year_built": field(H3, feature("build"), str),
+    "bedrooms": field(H3, feature("bedroom", startswith=True), int),
+    "bathrooms": field(H3, feature("bathroom", startswith=True), int),
+    "half_bathrooms": field(H3, feature("half bath", startswith=True), int),
+    "rooms": field(H3, feature("rooms"), int),
+    "representative": field(
+        ASIDE,
+        representative_from_aside(lambda info: text(find(info, "span"))),
+        str,
+    ),
+    "agency": field(ASIDE, representative_from_aside(agency_from_info), str),
+}
+
+EXTRACTOR = Extractor(SPEC)
+
+# part of the pages containing the listing, the head and scripts are not
+# parsed, the whole body is kept because getters count h3 and span tags
+REGION = region(start=b"<body")
+
+
+def parse_html(content):
+    """
+    Parse the part of a web page which contains the listing with lxml, to
+    use with parse_tree().
+
+    :param bytes|str content: HTML code
+    :return lxml.html.HtmlElement: root of the region's tree
+    """
+    return parse_region(content, REGION)
+
+
+def parse_tree(root):
+    """
+    Same as parse_webpage() but parses a page parsed with lxml (see
+    parse_html()), which is much faster: all tags are found in a
+    single traversal of the page.
+
+    :param lxml.html.HtmlElement root: root of the page's tree
+    :return dict: keys are home listing attributes and values are the
+                  corresponding values parsed from HTML
+    """
+    return EXTRACTOR.run(root)
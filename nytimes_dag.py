@@ -49,7 +49,8 @@ def wait_queue_empty():
 def extract(**context):
     crawler = Browser(
         base_url="https://www.nytimes.com",
-        soup_parser=nytimes.parse_soup.parse_webpage,
+        soup_parser=nytimes.parse_soup.parse_tree,
+        extract_parser=nytimes.parse_soup.parse_html,
         harvest_date=context["ds_nodash"],
         config_file="nytimes.conf",
     )
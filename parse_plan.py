@@ -0,0 +1,394 @@
+"""
+Parse web pages with lxml and find all the tags needed to extract data in a
+single traversal of the tree.
+
+A ParsePlan is compiled once from named selectors, each selector being a tag
+name and attributes, like the arguments of BeautifulSoup's find() and
+find_all(). Running the plan on a page returns the first tag, or all tags,
+matching each selector.
+
+An Extractor is compiled from a declarative spec of the fields to extract
+from a website's pages, each field being a selector, a post-processor and a
+type, and extracts all fields with a single ParsePlan.
+
+A Region declares the part of a website's pages which contains the data to
+extract, so only this part is parsed, see parse_region().
+"""
+import logging
+import re
+
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+
+import lxml.html
+
+from parsing_utils import string_to_float, string_to_int, to_null
+
+Selector = namedtuple("Selector", ["tag", "attrs", "many"])
+
+Field = namedtuple("Field", ["selectors", "process", "type"])
+
+Region = namedtuple("Region", ["start", "end", "skip"])
+
+# blocks of pages which never contain data to extract
+SKIPPED_TAGS = ("script", "style", "noscript", "svg", "iframe")
+
+CHARSET_REGEX = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+# convert strings returned by post-processors to the type of their field
+CONVERTERS = {
+    str: str.strip,
+    int: string_to_int,
+    float: string_to_float,
+}
+
+
+def select(tag, attrs=None, many=False):
+    """
+    Make a selector which matches tags like BeautifulSoup's find(tag, attrs)
+    or find_all(tag, attrs) if 'many' is True.
+
+    As in BeautifulSoup, a 'class' attribute matches a tag if it is one of
+    the tag's classes, or if it is the tag's whole class attribute, e.g.
+    'fa fa-map-signs'.
+
+    :param str tag: tag name
+    :param dict attrs: attributes the tag must have, a value of True
+        matches any value
+    :param bool many: match all tags instead of the first one
+    :return Selector: selector
+    """
+    return Selector(tag, tuple(sorted((attrs or {}).items())), many)
+
+
+def parse_html(content):
+    """
+    Parse a web page with lxml.
+
+    :param bytes|str content: HTML code
+    :return lxml.html.HtmlElement: root of the tree
+    """
+    return lxml.html.document_fromstring(content)
+
+
+def region(start=None, end=None, skip=SKIPPED_TAGS):
+    """
+    Declare the part of web pages to parse.
+
+    :param bytes start: the region starts at the first occurrence of these
+        bytes, e.g. b'<body', the page starts the region by default
+    :param bytes end: the region ends at the last occurrence of these bytes,
+        e.g. b'<footer', the page ends the region by default
+    :param tuple[str] skip: names of tags whose contents are removed from
+        the region before parsing, e.g. scripts
+    :return Region: region
+    """
+    skip_regex = None
+    if skip:
+        names = "|".join(skip).encode()
+        skip_regex = re.compile(
+            rb"<(" + names + rb")\b.*?</\1\s*>", re.S | re.I
+        )
+    return Region(start, end, skip_regex)
+
+
+@lru_cache(maxsize=None)
+def _html_parser(encoding):
+    try:
+        return lxml.html.HTMLParser(encoding=encoding)
+    except LookupError:
+        return lxml.html.HTMLParser(encoding="utf-8")
+
+
+def parse_region(content, region):
+    """
+    Parse the region of a web page with lxml, the rest of the page is never
+    parsed, which saves time and memory on pages with large headers,
+    footers and scripts. The whole page is parsed if the start or end of
+    the region is not found.
+
+    :param bytes|str content: HTML code
+    :param Region region: region to parse, see region()
+    :return lxml.html.HtmlElement: root of the region's tree
+    """
+    encoding = None
+    if isinstance(content, str):
+        content = content.encode()
+        encoding = "utf-8"
+    start = 0
+    if region.start:
+        start = max(content.find(region.start), 0)
+    end = len(content)
+    if region.end:
+        found = content.rfind(region.end, start)
+        if found > 0:
+            end = found
+    # the region may not contain the page's charset
+    if encoding is None:
+        charset = CHARSET_REGEX.search(content, 0, start or end)
+        encoding = charset.group(1).decode() if charset else "utf-8"
+    content = content[start:end]
+    if region.skip is not None:
+        content = region.skip.sub(b"", content)
+    return lxml.html.document_fromstring(
+        content, parser=_html_parser(encoding.lower())
+    )
+
+
+def text(element):
+    """
+    Get the text of a tag and its descendants, like BeautifulSoup's 'text'.
+
+    :param lxml.html.HtmlElement element: tag
+    :return str: text
+    """
+    return element.text_content()
+
+
+def nodes(element):
+    """
+    Get the children of a tag, including text, like BeautifulSoup's
+    'contents'.
+
+    :param lxml.html.HtmlElement element: tag
+    :return list: child tags and strings
+    """
+    return element.xpath("node()")
+
+
+def node_text(node):
+    """
+    Get the text of a tag or string returned by nodes().
+
+    :param node: tag or string
+    :return str: text
+    """
+    if isinstance(node, str):
+        return str(node)
+    return node.text_content()
+
+
+def next_sibling(element):
+    """
+    Get the node following a tag, like BeautifulSoup's 'next_sibling': the
+    text after the tag if any, else the next tag.
+
+    :param lxml.html.HtmlElement element: tag
+    :return: string or tag, or None
+    """
+    if element.tail:
+        return element.tail
+    return element.getnext()
+
+
+def next_node(element, n=1):
+    """
+    Get the n-th node after a tag in the document, including text, like
+    BeautifulSoup's 'next' applied n times.
+
+    :param lxml.html.HtmlElement element: tag
+    :param int n: number of nodes to move forward
+    :return: string or tag
+    """
+    return element.xpath(
+        f"(descendant::node() | following::node())[{n}]"
+    )[0]
+
+
+def find(element, tag, attrs=None):
+    """
+    Find the first descendant of a tag matching a tag name and attributes,
+    like BeautifulSoup's find(). Use it to search small parts of the tree,
+    e.g. the tags found by a ParsePlan.
+
+    :param lxml.html.HtmlElement element: tag to search
+    :param str tag: tag name
+    :param dict attrs: attributes the tag must have
+    :return lxml.html.HtmlElement: matching tag, or None
+    """
+    attrs = tuple((attrs or {}).items())
+    for child in element.iterdescendants(tag):
+        if _matches(child, attrs):
+            return child
+
+
+def find_all(element, tag, attrs=None):
+    """
+    Find the descendants of a tag matching a tag name and attributes, like
+    BeautifulSoup's find_all().
+
+    :param lxml.html.HtmlElement element: tag to search
+    :param str tag: tag name
+    :param dict attrs: attributes the tags must have
+    :return list[lxml.html.HtmlElement]: matching tags
+    """
+    attrs = tuple((attrs or {}).items())
+    return [
+        child for child in element.iterdescendants(tag)
+        if _matches(child, attrs)
+    ]
+
+
+def _matches(element, attrs):
+    for name, value in attrs:
+        actual = element.get(name)
+        if actual is None:
+            return False
+        if value is True:
+            continue
+        if name == "class":
+            classes = actual.split()
+            if value not in classes and " ".join(classes) != value:
+                return False
+        elif actual != value:
+            return False
+    return True
+
+
+class ParsePlan:
+    """
+    Find the tags matching a set of named selectors in a single traversal of
+    an lxml tree.
+    """
+    def __init__(self, selectors):
+        """
+        :param dict selectors: names of selectors mapped to selectors, see
+            select()
+        """
+        self.selectors = dict(selectors)
+        # tag name -> [(name, attrs, many)], to only test the selectors of
+        # a tag's name
+        self.by_tag = defaultdict(list)
+        for name, selector in self.selectors.items():
+            self.by_tag[selector.tag].append(
+                (name, selector.attrs, selector.many)
+            )
+        self.by_tag = dict(self.by_tag)
+        self.firsts = sum(not s.many for s in self.selectors.values())
+        self.has_many = self.firsts < len(self.selectors)
+
+    def __repr__(self):
+        return f"ParsePlan({list(self.selectors)})"
+
+    def run(self, root):
+        """
+        Find the tags matching the selectors.
+
+        :param lxml.html.HtmlElement root: root of the tree
+        :return dict: names of selectors mapped to the first matching tag,
+            or None, or to the list of matching tags for selectors which
+            match many tags
+        """
+        found = {
+            name: [] if selector.many else None
+            for name, selector in self.selectors.items()
+        }
+        remaining = self.firsts
+        by_tag = self.by_tag
+        for element in root.iter():
+            rules = by_tag.get(element.tag)
+            if rules is None:
+                continue
+            for name, attrs, many in rules:
+                if not many and found[name] is not None:
+                    continue
+                if not _matches(element, attrs):
+                    continue
+                if many:
+                    found[name].append(element)
+                else:
+                    found[name] = element
+                    remaining -= 1
+            # stop as soon as all tags were found
+            if remaining == 0 and not self.has_many:
+                break
+        return found
+
+
+def field(selectors=None, process=text, type=None):
+    """
+    Declare a field to extract from a web page.
+
+    :param Selector|tuple[Selector] selectors: selectors of the tags the
+        field is extracted from, fields without selectors are not available
+        and extracted as None
+    :param callable process: post-processor which takes the tags found by
+        each selector, None or lists of tags for selectors matching many
+        tags, and returns the field value
+    :param type type: str, int or float, strings returned by the
+        post-processor are converted to this type
+    :return Field: field
+    """
+    if isinstance(selectors, Selector):
+        selectors = (selectors,)
+    return Field(tuple(selectors or ()), process, type)
+
+
+@lru_cache(maxsize=None)
+def compile_selectors(selectors):
+    """
+    Compile selectors into a ParsePlan, plans are cached so specs sharing
+    the same selectors share the same plan.
+
+    :param tuple[Selector] selectors: selectors, selectors are named after
+        their index
+    :return ParsePlan: parse plan
+    """
+    return ParsePlan({i: selector for i, selector in enumerate(selectors)})
+
+
+class Extractor:
+    """
+    Extract fields declared in a spec from web pages parsed with lxml, the
+    tags needed by all fields are found in a single traversal of the page.
+    """
+    def __init__(self, spec):
+        """
+        :param dict spec: names of fields mapped to fields, see field()
+        """
+        self.spec = dict(spec)
+        # selectors used by several fields are matched once
+        selectors = []
+        for f in self.spec.values():
+            for selector in f.selectors:
+                if selector not in selectors:
+                    selectors.append(selector)
+        self.plan = compile_selectors(tuple(selectors))
+        self.fields = [
+            (
+                name,
+                tuple(selectors.index(s) for s in f.selectors),
+                f.process,
+                CONVERTERS.get(f.type),
+            )
+            for name, f in self.spec.items()
+        ]
+
+    def __repr__(self):
+        return f"Extractor({list(self.spec)})"
+
+    def run(self, root):
+        """
+        Extract the fields from a web page.
+
+        :param lxml.html.HtmlElement root: root of the page's tree
+        :return dict: names of fields mapped to their values, missing values
+            are 'NULL'
+        """
+        found = self.plan.run(root)
+        results = {}
+        for name, indexes, process, convert in self.fields:
+            if not indexes:
+                results[name] = None
+                continue
+            try:
+                value = process(*(found[i] for i in indexes))
+            except Exception as e:
+                logging.error(
+                    f"html tag parsing failed with '{name}' with error: {e}"
+                )
+                value = None
+            if convert is not None and isinstance(value, str):
+                value = convert(value)
+            results[name] = value
+        return to_null(results)
@@ -1,3 +1,46 @@
+import functools
+import json
+import logging
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# markers of the script tags containing JSON data embedded in web pages
+NEXT_DATA_MARKER = b"__NEXT_DATA__"
+JSON_LD_MARKER = b"application/ld+json"
+
+
+def safety_net(func):
+    """
+    Decorate a function parsing a web page so it logs errors and returns
+    None instead of raising them, e.g. when a tag is missing from the page.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            logging.error(
+                f"html tag parsing failed with '{func.__name__}' "
+                f"with error: {e}"
+            )
+    return wrapper
+
+
+def clean_string(string):
+    """
+    Remove unwanted characters from strings (symbols, HTML characters, etc).
+
+    :param str string: string to clean
+    :returns: str - cleaned string
+    """
+    remap = {ord(c): None for c in ("$", ",", "\xa0")}
+    return string.translate(remap).strip()
+
+
 def string_to_float(string):
     """
     Convert a string representing a number to a float.
@@ -5,13 +48,120 @@ def string_to_float(string):
     :param str string: string to convert
     :return float:
     """
-    remap = {
-        ord(","): None,
-        ord("$"): None,
-        ord("\xa0"): None,
-    }
-    clean = string.translate(remap)
+    clean = clean_string(string)
     try:
         return float(clean)
     except ValueError:
         return float("nan")
+
+
+def string_to_int(string):
+    """
+    Convert a string representing a number to a int.
+    Return 'NaN' if the string can't be converted to an integer.
+
+    :param str string: string to convert
+    :return int|nan:
+    """
+    clean = clean_string(string)
+    try:
+        return int(clean)
+    except ValueError:
+        return float("nan")
+
+
+def to_null(d):
+    """
+    Convert the NaN (not a number) or empty values of a dictionary to the
+    string 'NULL'.
+
+    :param dict d: dictionary to convert
+    :return dict: dictionary where NaN and empty values are 'NULL'
+    """
+    for key, value in d.items():
+        if isinstance(value, float):
+            if math.isnan(value):
+                d[key] = "NULL"
+        elif isinstance(value, str):
+            if not value:
+                d[key] = "NULL"
+        elif value is None:
+            d[key] = "NULL"
+    return d
+
+
+def loads_json(data):
+    """
+    Decode JSON with orjson if it is installed, which is several times
+    faster than the json module.
+
+    :param bytes|str data: JSON document
+    :return: decoded data
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def find_scripts(content, marker):
+    """
+    Find the contents of the script tags whose opening tag contains a
+    marker, e.g. their ID or type, by scanning the bytes of a web page
+    without parsing it.
+
+    :param bytes|str content: HTML code
+    :param bytes marker: bytes the opening tag contains
+    :return generator[bytes]: contents of the script tags
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    index = content.find(marker)
+    while index >= 0:
+        tag_start = content.rfind(b"<", 0, index)
+        tag_end = content.find(b">", index)
+        if tag_end < 0:
+            return
+        # the marker may be found elsewhere, e.g. in a script's code
+        opening = content[tag_start:index]
+        if opening[:7].lower() == b"<script" and b">" not in opening:
+            script_end = content.find(b"</script", tag_end)
+            if script_end < 0:
+                return
+            yield content[tag_end + 1:script_end]
+            tag_end = script_end
+        index = content.find(marker, tag_end)
+
+
+def get_next_data(content):
+    """
+    Get the data embedded by Next.js websites in the '__NEXT_DATA__' script
+    tag of their pages, without parsing the page.
+
+    :param bytes|str content: HTML code
+    :return dict: embedded data, or None if the page has none
+    """
+    for script in find_scripts(content, NEXT_DATA_MARKER):
+        return loads_json(script)
+
+
+def get_json_ld(content):
+    """
+    Get the JSON-LD (linked data) objects embedded in a web page, e.g.
+    schema.org descriptions of listings, without parsing the page. Scripts
+    which are not valid JSON are skipped.
+
+    :param bytes|str content: HTML code
+    :return list: JSON-LD objects
+    """
+    objects = []
+    for script in find_scripts(content, JSON_LD_MARKER):
+        try:
+            data = loads_json(script)
+        except ValueError:
+            logging.error("failed to decode JSON-LD script")
+            continue
+        if isinstance(data, list):
+            objects.extend(data)
+        else:
+            objects.append(data)
+    return objects
@@ -1,11 +1,18 @@
 import json
+import os
+import sys
 import time
 
 import requests
-from bs4 import BeautifulSoup
 
 from utils import LOGGER, make_headers, get_cookies
 
+# parsing utilities are shared with the other websites, appended to the path
+# so this directory's modules keep precedence
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsing_utils import get_next_data
+
 URL = (
     "https://www.realtor.com/realestateandhomes-detail/"
     "{permalink}?from=srp-list-card"
@@ -30,8 +37,7 @@ def add_cookies_to_headers(headers, cookies):
 
 
 def parse_description_from_html(html):
-    soup = BeautifulSoup(html, "html.parser")
-    data = json.loads(soup.find(id="__NEXT_DATA__").text)
+    data = get_next_data(html)
     return data["props"]["pageProps"]["initialReduxState"]["propertyDetails"][
         "description"
     ]["text"]
@@ -44,11 +50,7 @@ def get_description(permalink, cookies):
     resp = make_request(URL.format(permalink=permalink), headers)
     status_code = resp.status_code
     if status_code == 200:
-        soup = BeautifulSoup(resp.text, "html.parser")
-        data = json.loads(soup.find(id="__NEXT_DATA__").text)
-        desc = data["props"]["pageProps"]["initialReduxState"][
-            "propertyDetails"
-        ]["description"]["text"]
+        desc = parse_description_from_html(resp.content)
     else:
         desc = ""
     return status_code, desc
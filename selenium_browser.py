@@ -45,10 +45,12 @@ class Browser:
         wait_page_load=20,
         html_parser="html.parser",
         soup_parser=None,
+        extract_parser=None,
         geolocator=None,
         config_file="browser.conf",
         override_user_agents=True,
         harvest_date=None,
+        resource_filter=None,
     ):
         """
         Automated web browser.
@@ -82,16 +84,22 @@ class Browser:
                                      before downloading a page
         :param float wait_page_load: time in seconds to wait for a page to
                                      load before downloading contents
-        :param str html_parser: parser to use with BeautifulSoup, e.g.
-                                'html.parser', 'lxml', etc
+        :param str|callable html_parser: parser to use with BeautifulSoup,
+                                         e.g. 'html.parser', 'lxml', etc,
+                                         or function which parses HTML
         :param callable soup_parser: function to use to parse the HTML tags
                                      soup into a dictionary
+        :param callable extract_parser: function which parses HTML into the
+                                        tree passed to soup_parser in
+                                        extract(), defaults to html_parser
         :param callable geolocator: function which adds latitude and longitude
                                     to a home listing
         :param str config_file: name of the configuration file
         :param bool override_user_agents: if True, overrides the native user
                                           agent of the Selenium webdriver
         :param str harvest_date: date of harvest, format YYYYMMDD
+        :param ResourceFilter resource_filter: filter of the resources the
+                                               webdriver downloads
         """
         self.base_url = base_url
         self.stop_test = stop_test
@@ -108,11 +116,15 @@ class Browser:
         self.explored = Explored()
         self.harvest_pauses = 0
         self.override_user_agents = override_user_agents
+        self.resource_filter = resource_filter
         self.harvest_date = self.set_harvest_date(harvest_date)
         if not html_parser:
             self.html_parser = partial(BeautifulSoup, features="html.parser")
+        elif callable(html_parser):
+            self.html_parser = html_parser
         else:
             self.html_parser = partial(BeautifulSoup, features=html_parser)
+        self.extract_parser = extract_parser or self.html_parser
         self.geolocator = geolocator
 
         # parse the robots.txt file
@@ -207,6 +219,8 @@ class Browser:
                 "general.useragent.override",
                 self.user_agent
             )
+        if self.resource_filter:
+            self.resource_filter.apply(profile)
 
         self.webdriver = webdriver.Firefox(
             executable_path=driver_path,
@@ -441,8 +455,9 @@ class Browser:
         """
         Parse HTML code from web pages to extract information and store as a
         CSV file.
-        HTML is processed according to the function passed in 'html_parser' and
-        data is extracted according to the function passed in 'soup_parser'.
+        HTML is processed according to the function passed in
+        'extract_parser' and data is extracted according to the function
+        passed in 'soup_parser'.
         """
         with TemporaryDirectory() as temp_dir:
             logging.info(f"downloading files to {temp_dir}")
@@ -470,7 +485,7 @@ class Browser:
                     with bz2.open(f, "rb") as zip_file:
                         writer.writerow({
                             **self.soup_parser(
-                                self.html_parser(zip_file.read())
+                                self.extract_parser(zip_file.read())
                             ),
                             "listing_id": listing_id,
                             "source": urlparse(self.base_url).netloc,
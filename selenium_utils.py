@@ -0,0 +1,133 @@
+from urllib.parse import quote, urlparse
+
+# Firefox preferences which block each type of resource
+BLOCKING_PREFERENCES = {
+    "images": {
+        "permissions.default.image": 2,
+    },
+    "stylesheets": {
+        "permissions.default.stylesheet": 2,
+    },
+    "fonts": {
+        "gfx.downloadable_fonts.enabled": False,
+        "browser.display.use_document_fonts": 0,
+    },
+    "media": {
+        "media.autoplay.default": 5,
+        "media.preload.default": 0,
+        "media.preload.auto": 0,
+    },
+    "scripts": {
+        "javascript.enabled": False,
+    },
+    # ads, analytics and third-party cookies
+    "trackers": {
+        "privacy.trackingprotection.enabled": True,
+        "network.cookie.cookieBehavior": 1,
+    },
+}
+
+# address where requests to blocked domains are sent, nothing listens there
+BLACKHOLE_PROXY = "127.0.0.1:9"
+
+PAC_TEMPLATE = """function FindProxyForURL(url, host) {{
+    var allowed = [{domains}];
+    for (var i = 0; i < allowed.length; i++) {{
+        if (host == allowed[i] || dnsDomainIs(host, "." + allowed[i])) {{
+            return "{allowed_route}";
+        }}
+    }}
+    return "PROXY {blackhole}";
+}}"""
+
+
+class ResourceFilter:
+    """
+    Stop Firefox from downloading resources which are not needed to parse
+    the page's DOM, e.g. images, fonts, ads and analytics, through browser
+    preferences.
+
+    Resource types are 'images', 'stylesheets', 'fonts', 'media', 'scripts'
+    and 'trackers', all are blocked except the allowed types. Scripts are
+    allowed by default because many websites render listings with
+    JavaScript.
+
+    With 'allowed_domains', requests to other domains are blocked with a
+    proxy auto-config (PAC) script, e.g. to block third-party scripts while
+    running the website's own scripts.
+    """
+    def __init__(self, allow=("scripts",), allowed_domains=None):
+        """
+        :param tuple[str] allow: resource types to download
+        :param list[str] allowed_domains: domains, including their
+            subdomains, Firefox may send requests to, all domains are
+            allowed by default
+        """
+        unknown = set(allow) - set(BLOCKING_PREFERENCES)
+        if unknown:
+            raise ValueError(
+                f"resource types should be in {list(BLOCKING_PREFERENCES)}, "
+                f"got: {sorted(unknown)}"
+            )
+        self.allow = tuple(allow)
+        self.allowed_domains = list(allowed_domains or [])
+
+    @classmethod
+    def for_site(cls, base_url, allow=("scripts",), extra_domains=()):
+        """
+        Make a filter which only allows requests to a website's domain.
+
+        :param str base_url: URL of the website
+        :param tuple[str] allow: resource types to download
+        :param tuple[str] extra_domains: other domains to allow, e.g. the
+            website's CDN or API
+        :return ResourceFilter: resource filter
+        """
+        domain = urlparse(base_url).netloc
+        if domain.startswith("www."):
+            domain = domain[len("www."):]
+        return cls(allow, [domain, *extra_domains])
+
+    def preferences(self, proxy=None):
+        """
+        Get the Firefox preferences which apply the filter.
+
+        :param str proxy: 'host:port' of the proxy requests to allowed
+            domains go through, if any
+        :return dict: Firefox preferences
+        """
+        prefs = {}
+        for resource, blocking in BLOCKING_PREFERENCES.items():
+            if resource not in self.allow:
+                prefs.update(blocking)
+        if self.allowed_domains:
+            prefs["network.proxy.type"] = 2
+            prefs["network.proxy.autoconfig_url"] = self.pac_url(proxy)
+        return prefs
+
+    def pac_url(self, proxy=None):
+        """
+        Make a data URL of a PAC script which blocks requests to domains
+        which are not allowed.
+
+        :param str proxy: 'host:port' of the proxy requests to allowed
+            domains go through, if any
+        :return str: data URL
+        """
+        pac = PAC_TEMPLATE.format(
+            domains=", ".join(f'"{d}"' for d in self.allowed_domains),
+            allowed_route=f"PROXY {proxy}" if proxy else "DIRECT",
+            blackhole=BLACKHOLE_PROXY,
+        )
+        return f"data:application/x-ns-proxy-autoconfig,{quote(pac)}"
+
+    def apply(self, profile, proxy=None):
+        """
+        Set the filter preferences of a Firefox profile.
+
+        :param profile: selenium FirefoxProfile or FirefoxOptions
+        :param str proxy: 'host:port' of the proxy requests to allowed
+            domains go through, if any
+        """
+        for name, value in self.preferences(proxy).items():
+            profile.set_preference(name, value)
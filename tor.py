@@ -2,78 +2,172 @@ import stem
 from stem.control import Controller
 from stem.process import launch_tor_with_config
 
+import logging
+import queue
 import requests
+import secrets
+import threading
 
 import time
 
+from contextlib import contextmanager
 
-class TorSession:
+
+def launch_tor(proxy_port=9050, ctrl_port=9051):
+    return launch_tor_with_config(
+        config={
+            "SocksPort": str(proxy_port),
+            "ControlPort": str(ctrl_port),
+            "ExitNodes": "{US}",
+        },
+        take_ownership=True,
+    )
+
+
+class TorController:
+    """
+    Own the Tor daemon, launched if it is not running, and a single
+    authenticated controller connection, and make lightweight sessions which
+    send requests through Tor.
+
+    Use get_controller() to share one controller per control port.
+    """
     def __init__(self, proxy_port=9050, ctrl_port=9051, password=None):
         self.proxy_port = proxy_port
         self.ctrl_port = ctrl_port
-        # keep track of number of requests made
-        self.used = 0
+        self.lock = threading.Lock()
 
         self._tor_proc = None
-        if not self._tor_process_exists():
-            self._tor_proc = self._launch_tor()
-
-        self.ctrl = Controller.from_port(port=self.ctrl_port)
+        try:
+            self.ctrl = Controller.from_port(port=self.ctrl_port)
+        except stem.SocketError:
+            self._tor_proc = launch_tor(self.proxy_port, self.ctrl_port)
+            self.ctrl = Controller.from_port(port=self.ctrl_port)
         self.ctrl.authenticate(password=password)
 
-        self.session = requests.Session()
-        self.session.proxies.update(
-            {
-                "http": "socks5://localhost:%d" % self.proxy_port,
-                "https": "socks5://localhost:%d" % self.proxy_port,
-            }
-        )
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
-    def mount(self, *args, **kwargs):
-        return self.session.mount(*args, **kwargs)
+    def proxies(self, isolate=False):
+        """
+        Make the proxies of a requests session to use Tor.
 
-    def _tor_process_exists(self):
-        try:
-            ctrl = Controller.from_port(port=self.ctrl_port)
-            ctrl.close()
-            return True
-        except Exception:
-            return False
-
-    def _launch_tor(self):
-        return launch_tor_with_config(
-            config={
-                "SocksPort": str(self.proxy_port),
-                "ControlPort": str(self.ctrl_port),
-                "ExitNodes": "{US}",
-            },
-            take_ownership=True,
-        )
+        :param bool isolate: use random SOCKS credentials, so Tor uses a
+            circuit for this session only (IsolateSOCKSAuth)
+        :return dict: requests proxies
+        """
+        credentials = ""
+        if isolate:
+            token = secrets.token_hex(8)
+            credentials = f"{token}:{token}@"
+        proxy = f"socks5://{credentials}localhost:{self.proxy_port}"
+        return {"http": proxy, "https": proxy}
+
+    def session(self, isolate=False):
+        """
+        Make a requests session which sends requests through Tor.
+
+        :param bool isolate: use a circuit for this session only
+        :return requests.Session: session
+        """
+        session = requests.Session()
+        session.proxies.update(self.proxies(isolate))
+        return session
+
+    def new_identity(self, wait=False):
+        """
+        Signal Tor to use new circuits for new connections (NEWNYM).
+
+        :param bool wait: wait until Tor accepts a new NEWNYM signal
+        """
+        with self.lock:
+            self.ctrl.signal(stem.Signal.NEWNYM)
+            delay = self.ctrl.get_newnym_wait()
+        if wait:
+            time.sleep(delay)
 
     def close(self):
         try:
-            self.session.close()
+            self.ctrl.close()
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception:
             pass
 
+        if self._tor_proc:
+            self._tor_proc.terminate()
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(proxy_port=9050, ctrl_port=9051, password=None):
+    """
+    Get the Tor controller of a control port, created on first call and
+    shared by later calls.
+
+    :param int proxy_port: Tor SOCKS port
+    :param int ctrl_port: Tor control port
+    :param str password: password of the control port
+    :return TorController: controller
+    """
+    with _controllers_lock:
+        controller = _controllers.get(ctrl_port)
+        if controller is None:
+            controller = TorController(proxy_port, ctrl_port, password)
+            _controllers[ctrl_port] = controller
+        return controller
+
+
+class TorSession:
+    """
+    requests session which sends requests through Tor. The Tor daemon and
+    controller are shared by all sessions, see get_controller(), so making a
+    session is cheap.
+    """
+    def __init__(
+        self,
+        proxy_port=9050,
+        ctrl_port=9051,
+        password=None,
+        isolate=False,
+    ):
+        """
+        :param int proxy_port: Tor SOCKS port
+        :param int ctrl_port: Tor control port
+        :param str password: password of the control port
+        :param bool isolate: use a circuit for this session only, so the
+            session gets a new identity without NEWNYM
+        """
+        self.proxy_port = proxy_port
+        self.ctrl_port = ctrl_port
+        # keep track of number of requests made
+        self.used = 0
+
+        self.controller = get_controller(proxy_port, ctrl_port, password)
+        self.ctrl = self.controller.ctrl
+        self.session = self.controller.session(isolate)
+
+    def mount(self, *args, **kwargs):
+        return self.session.mount(*args, **kwargs)
+
+    def close(self):
         try:
-            self.ctrl.close()
+            self.session.close()
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception:
             pass
 
-        if self._tor_proc:
-            self._tor_proc.terminate()
-
     def reset_identity_async(self):
-        self.ctrl.signal(stem.Signal.NEWNYM)
+        self.controller.new_identity()
 
     def reset_identity(self):
-        self.reset_identity_async()
-        time.sleep(self.ctrl.get_newnym_wait())
+        self.controller.new_identity(wait=True)
 
     def get(self, *args, **kwargs):
         self.used += 1
@@ -100,3 +194,169 @@ class TorSession:
 
     def __exit__(self, *args):
         self.close()
+
+
+class TorCircuit:
+    """
+    HTTP session whose requests go through their own Tor circuit.
+
+    Tor isolates streams which authenticate to its SOCKS port with different
+    credentials (IsolateSOCKSAuth, enabled by default), so each circuit uses
+    random credentials. A circuit gets a new identity by changing its
+    credentials, which does not affect other circuits, unlike NEWNYM.
+    """
+    def __init__(self, controller, configure=None):
+        """
+        :param TorController controller: controller of the Tor daemon
+        :param callable configure: function called with each new
+            requests.Session, e.g. to mount adapters
+        """
+        self.controller = controller
+        self.configure = configure
+        self.session = None
+        self.renew()
+
+    def renew(self):
+        """
+        Use new credentials, and so a new circuit, for the next requests.
+        """
+        session = self.controller.session(isolate=True)
+        if self.configure:
+            self.configure(session)
+        old, self.session = self.session, session
+        self.used = 0
+        self.renewed_at = time.monotonic()
+        if old is not None:
+            old.close()
+
+    def close(self):
+        self.session.close()
+
+    def get(self, *args, **kwargs):
+        self.used += 1
+        return self.session.get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        self.used += 1
+        return self.session.post(*args, **kwargs)
+
+
+class TorCircuitPool:
+    """
+    Pool of Tor circuits which download workers borrow, see TorCircuit.
+
+    Circuits which were used for 'max_requests' requests or are older than
+    'max_age' seconds get a new identity in a background thread while the
+    other circuits keep downloading, so downloads never wait for a new
+    identity.
+    """
+    def __init__(
+        self,
+        size=4,
+        proxy_port=9050,
+        ctrl_port=9051,
+        password=None,
+        max_requests=50,
+        max_age=None,
+        configure=None,
+        warm_url=None,
+    ):
+        """
+        :param int size: number of circuits
+        :param int proxy_port: Tor SOCKS port
+        :param int ctrl_port: Tor control port
+        :param str password: password of the control port
+        :param int max_requests: number of requests made with a circuit
+            before it gets a new identity, 0 for no limit
+        :param float max_age: time in seconds a circuit is used before it
+            gets a new identity, no limit by default
+        :param callable configure: function called with each new
+            requests.Session, e.g. to mount adapters
+        :param str warm_url: if given, URL requested by the background
+            thread after a circuit gets a new identity, so Tor builds the
+            circuit before a worker uses it
+        """
+        self.max_requests = max_requests
+        self.max_age = max_age
+        self.warm_url = warm_url
+
+        self.controller = get_controller(proxy_port, ctrl_port, password)
+        self.circuits = [
+            TorCircuit(self.controller, configure) for _ in range(size)
+        ]
+        self.idle = queue.Queue()
+        self.stale = queue.Queue()
+        for circuit in self.circuits:
+            self.idle.put(circuit)
+
+        self.stop = threading.Event()
+        self.rotator = threading.Thread(target=self._rotate, daemon=True)
+        self.rotator.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _expired(self, circuit):
+        if self.max_requests and circuit.used >= self.max_requests:
+            return True
+        if self.max_age is not None:
+            return time.monotonic() - circuit.renewed_at > self.max_age
+        return False
+
+    def _rotate(self):
+        """
+        Give a new identity to stale circuits until the pool is closed.
+        Runs in a background thread.
+        """
+        while not self.stop.is_set():
+            try:
+                circuit = self.stale.get(timeout=1)
+            except queue.Empty:
+                continue
+            circuit.renew()
+            if self.warm_url:
+                try:
+                    circuit.session.head(self.warm_url, timeout=30)
+                except Exception as e:
+                    logging.warning(f"failed to warm Tor circuit: {e}")
+            self.idle.put(circuit)
+
+    def acquire(self):
+        """
+        Borrow a circuit, waiting until one is available.
+
+        :return TorCircuit: circuit to download with
+        """
+        while True:
+            circuit = self.idle.get()
+            if not self._expired(circuit):
+                return circuit
+            self.stale.put(circuit)
+
+    def release(self, circuit):
+        """
+        Give back a borrowed circuit.
+
+        :param TorCircuit circuit: borrowed circuit
+        """
+        if self._expired(circuit):
+            self.stale.put(circuit)
+        else:
+            self.idle.put(circuit)
+
+    @contextmanager
+    def circuit(self):
+        circuit = self.acquire()
+        try:
+            yield circuit
+        finally:
+            self.release(circuit)
+
+    def close(self):
+        self.stop.set()
+        self.rotator.join()
+        for circuit in self.circuits:
+            circuit.close()
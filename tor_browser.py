@@ -300,10 +300,9 @@ class Browser:
         backoff_factor,
         retry_on,
     ):
-        # new IP only after reset_identity() is called and new session is made
-        session = TorSession(password=os.getenv("TOR_PASSWORD"))
-        session.reset_identity()
-        session = TorSession(password=os.getenv("TOR_PASSWORD"))
+        # the session uses its own circuit, so it gets a new IP without
+        # waiting for reset_identity()
+        session = TorSession(password=os.getenv("TOR_PASSWORD"), isolate=True)
 
         retry = Retry(
             total=max_retries,
@@ -1,4 +1,3 @@
-import bz2
 import csv
 import glob
 import hashlib
@@ -20,6 +19,7 @@ from urllib.parse import urljoin, urlparse
 
 import boto3
 
+from botocore.exceptions import ClientError
 from bs4 import BeautifulSoup
 from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
@@ -27,7 +27,9 @@ from requests.packages.urllib3.util.retry import Retry
 
 import aws_utils
 
+from harvest_codecs import get_codec
 from tor import TorSession
+from utils import page_digest
 
 CONFIG_DIR = os.path.join(str(Path.home()), ".browsing")
 MAX_TOR_REQ = 50
@@ -93,9 +95,12 @@ class Browser:
         browse_delay=0,
         html_parser="html.parser",
         soup_parser=None,
+        extract_parser=None,
         geolocator=None,
         config_file="browser.conf",
         harvest_date=None,
+        codec="bz2",
+        dedup=False,
     ):
         """
         Automated web browser.
@@ -129,14 +134,24 @@ class Browser:
         :param list[int] retry_on: HTTP status codes allowing request retry
         :param float browse_delay: time in seconds to wait between page
                                    downloads
-        :param str html_parser: parser to use with BeautifulSoup, e.g.
-                                'html.parser', 'lxml', etc
+        :param str|callable html_parser: parser to use with BeautifulSoup,
+                                         e.g. 'html.parser', 'lxml', etc,
+                                         or function which parses HTML
         :param callable soup_parser: function to use to parse the HTML tags
                                      soup into a dictionary
+        :param callable extract_parser: function which parses HTML into the
+                                        tree passed to soup_parser in
+                                        extract(), defaults to html_parser
         :param callable geolocator: function which adds latitude and longitude
                                     to a home listing
         :param str config_file: name of the configuration file
         :param str harvest_date: date of harvest, format YYYYMMDD
+        :param str|object codec: codec used to compress harvested pages, see
+                                 harvest_codecs.get_codec()
+        :param bool dedup: store identical pages only once, harvested pages
+                           are then references to the unique pages, and
+                           extract() skips pages extracted by a previous
+                           run
         """
         self.base_url = base_url
         self.stop_test = stop_test
@@ -159,9 +174,16 @@ class Browser:
         self.harvest_date = self.set_harvest_date(harvest_date)
         if not html_parser:
             self.html_parser = partial(BeautifulSoup, features="html.parser")
+        elif callable(html_parser):
+            self.html_parser = html_parser
         else:
             self.html_parser = partial(BeautifulSoup, features=html_parser)
+        self.extract_parser = extract_parser or self.html_parser
         self.geolocator = geolocator
+        self.codec = get_codec(codec)
+        self.dedup = dedup
+        # hashes of pages known to be stored in S3
+        self.stored_digests = set()
 
         # parse the robots.txt file
         try:
@@ -330,30 +352,144 @@ class Browser:
 
     def store_harvest(self, file_prefix, data):
         """
-        Stores the data from a web page in a bz2 file and store it in
+        Compress the data from a web page with self.codec and store it in
         AWS S3.
 
         :param str file_prefix: name of the compressed file without extension
         :param bytes data: data to store
         """
-        compressed = bz2.compress(data)
-        k = f"{self.harvest_key_prefix}/{self.harvest_date}/{file_prefix}.bz2"
+        if self.dedup:
+            self.store_harvest_reference(file_prefix, data)
+            return
+
+        compressed = self.codec.compress(data)
+        k = (
+            f"{self.harvest_key_prefix}/{self.harvest_date}/"
+            f"{file_prefix}{self.codec.extension}"
+        )
         self.s3_client.put_object(
             Body=compressed,
             Bucket=self.s3_bucket,
             Key=k,
         )
 
+    def store_harvest_reference(self, file_prefix, data):
+        """
+        Store the data from a web page in AWS S3 under a key made from the
+        hash of its normalized contents, unless it is already stored, and
+        store a reference to this key for the harvest date.
+
+        :param str file_prefix: name of the reference file without extension
+        :param bytes data: data to store
+        """
+        digest = page_digest(data)
+        page_key = (
+            f"{self.harvest_key_prefix}/pages/{digest}{self.codec.extension}"
+        )
+        if digest not in self.stored_digests:
+            try:
+                self.s3_client.head_object(Bucket=self.s3_bucket, Key=page_key)
+            except ClientError as e:
+                if not aws_utils.is_missing(e):
+                    raise
+                self.s3_client.put_object(
+                    Body=self.codec.compress(data),
+                    Bucket=self.s3_bucket,
+                    Key=page_key,
+                )
+            self.stored_digests.add(digest)
+
+        ref_key = (
+            f"{self.harvest_key_prefix}/{self.harvest_date}/{file_prefix}.ref"
+        )
+        self.s3_client.put_object(
+            Body=page_key.encode(),
+            Bucket=self.s3_bucket,
+            Key=ref_key,
+        )
+
+    def resolve_harvest_references(self, directory, extracted=()):
+        """
+        Download the pages referenced by the reference files of a directory,
+        and remove the reference files. Each page is downloaded once, even if
+        several reference files point to it, and pages whose digest is in
+        'extracted' are not downloaded.
+
+        :param str directory: directory of downloaded harvest files
+        :param set extracted: digests of pages already extracted
+        :return dict: paths of downloaded pages mapped to the list of file
+            prefixes (listing IDs) which reference them
+        """
+        references = {}
+        for f in glob.glob(f"{directory}/*.ref"):
+            with open(f) as ref_file:
+                page_key = ref_file.read()
+            file_prefix = os.path.split(os.path.splitext(f)[0])[-1]
+            references.setdefault(page_key, []).append(file_prefix)
+            os.remove(f)
+
+        pages_dir = os.path.join(directory, "pages")
+        os.makedirs(pages_dir, exist_ok=True)
+        pages = {}
+        for page_key, file_prefixes in references.items():
+            if self.page_key_digest(page_key) in extracted:
+                logging.info(
+                    f"skipping {len(file_prefixes)} unchanged pages "
+                    f"{page_key}"
+                )
+                continue
+            path = os.path.join(pages_dir, os.path.split(page_key)[-1])
+            self.s3_client.download_file(self.s3_bucket, page_key, path)
+            pages[path] = file_prefixes
+        return pages
+
+    def page_key_digest(self, page_key):
+        """
+        :param str page_key: S3 key or path of a deduplicated page
+        :return str: digest of the page contents
+        """
+        file_name = os.path.split(page_key)[-1]
+        return file_name[:len(file_name) - len(self.codec.extension)]
+
+    def get_extracted_digests(self):
+        """
+        Get the digests of the deduplicated pages already extracted, stored
+        in S3 next to the pages.
+
+        :return set[str]: digests of extracted pages
+        """
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.s3_bucket,
+                Key=f"{self.harvest_key_prefix}/pages/extracted",
+            )
+        except ClientError as e:
+            if not aws_utils.is_missing(e):
+                raise
+            return set()
+        return set(response["Body"].read().decode().split())
+
+    def put_extracted_digests(self, digests):
+        """
+        Store the digests of the deduplicated pages already extracted in S3.
+
+        :param set[str] digests: digests of extracted pages
+        """
+        self.s3_client.put_object(
+            Body="\n".join(sorted(digests)).encode(),
+            Bucket=self.s3_bucket,
+            Key=f"{self.harvest_key_prefix}/pages/extracted",
+        )
+
     def get_session(
         self,
         max_retries,
         backoff_factor,
         retry_on,
     ):
-        # new IP only after reset_identity() is called and new session is made
-        session = TorSession(password=os.getenv("TOR_PASSWORD"))
-        session.reset_identity()
-        session = TorSession(password=os.getenv("TOR_PASSWORD"))
+        # the session uses its own circuit, so it gets a new IP without
+        # waiting for reset_identity()
+        session = TorSession(password=os.getenv("TOR_PASSWORD"), isolate=True)
 
         retry = Retry(
             total=max_retries,
@@ -511,8 +647,13 @@ class Browser:
         """
         Parse HTML code from web pages to extract information and store as a
         CSV file.
-        HTML is processed according to the function passed in 'html_parser' and
-        data is extracted according to the function passed in 'soup_parser'.
+        HTML is processed according to the function passed in
+        'extract_parser' and data is extracted according to the function
+        passed in 'soup_parser'.
+
+        With 'dedup', a page referenced by several listings is parsed once,
+        and pages which were already extracted by a previous run, i.e. did
+        not change since, are skipped.
         """
         with TemporaryDirectory() as temp_dir:
             logging.info(f"downloading files to {temp_dir}")
@@ -521,6 +662,11 @@ class Browser:
                 f"{self.harvest_key_prefix}/{self.harvest_date}",
                 temp_dir,
             )
+            extracted = self.get_extracted_digests() if self.dedup else set()
+            pages = self.resolve_harvest_references(temp_dir, extracted)
+            new_digests = {self.page_key_digest(path) for path in pages}
+            for f in glob.glob(f"{temp_dir}/*{self.codec.extension}"):
+                pages[f] = [os.path.split(os.path.splitext(f)[0])[-1]]
 
             csv_path = os.path.join(temp_dir, "extract.csv")
             with open(csv_path, "w") as csv_file:
@@ -533,15 +679,18 @@ class Browser:
 
                 # iterate over HTML documents, extract data and write to CSV
                 file_names = []
-                for f in glob.glob(f"{temp_dir}/*.bz2"):
+                for f, listing_ids in pages.items():
                     logging.info(f"parsing {f}")
-                    listing_id = os.path.split(os.path.splitext(f)[0])[-1]
-                    file_names += listing_id,
-                    with bz2.open(f, "rb") as zip_file:
+                    with open(f, "rb") as zip_file:
+                        data = self.soup_parser(
+                            self.extract_parser(
+                                self.codec.decompress(zip_file.read())
+                            )
+                        )
+                    for listing_id in listing_ids:
+                        file_names += listing_id,
                         writer.writerow({
-                            **self.soup_parser(
-                                self.html_parser(zip_file.read())
-                            ),
+                            **data,
                             "listing_id": listing_id,
                             "source": urlparse(self.base_url).netloc,
                             "collection_date": self.harvest_date,
@@ -570,6 +719,11 @@ class Browser:
                 csv_s3_key,
             )
 
+            # only once the data is uploaded, so pages are extracted again
+            # if this run fails
+            if self.dedup and new_digests:
+                self.put_extracted_digests(extracted | new_digests)
+
         logging.info("extraction finished")
 
     def geolocalize(self):
@@ -1,13 +1,23 @@
+import asyncio
 import errno
 import hashlib
+import heapq
+import itertools
 import logging
+import mmap
 import os
+import queue
+import re
 import signal
+import sqlite3
+import struct
+import threading
+import time
 
 from collections import deque
 from functools import wraps
 from urllib.error import URLError
-from urllib.parse import urljoin
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse
 from urllib.robotparser import RobotFileParser
 
 import boto3
@@ -38,6 +48,53 @@ def check_status(response):
         raise ValueError(f"Expected HTTP status code 200, got: {code}")
 
 
+# parts of web pages which change between downloads without changing the data
+# we extract, e.g. ads, analytics, CSRF tokens, render timestamps
+# scripts which embed JSON data are kept
+SCRIPT_REGEX = re.compile(
+    rb"<script(?![^>]*(?:json|__NEXT_DATA__))[^>]*>.*?</script\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+VOLATILE_TAGS_REGEX = re.compile(
+    rb"<(style|noscript|iframe)\b.*?</\1\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+COMMENT_REGEX = re.compile(rb"<!--.*?-->", re.DOTALL)
+WHITESPACE_REGEX = re.compile(rb"\s+")
+BETWEEN_TAGS_REGEX = re.compile(rb">\s+<")
+
+# page number of listing pages, e.g. '?page=3', '&p=3', '?s=240', '/3_p/'
+PAGE_NUMBER_REGEX = re.compile(r"[?&](?:page|p|s)=(\d+)|/(\d+)_p/")
+
+
+def normalize_page(content):
+    """
+    Remove scripts, styles, frames, comments and repeated whitespace from a
+    web page, so that downloads of the same page with the same data are
+    byte-identical. Scripts which embed JSON data are kept.
+
+    :param str|bytes content: HTML code
+    :return bytes: normalized HTML code
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    content = SCRIPT_REGEX.sub(b"", content)
+    content = VOLATILE_TAGS_REGEX.sub(b"", content)
+    content = COMMENT_REGEX.sub(b"", content)
+    content = BETWEEN_TAGS_REGEX.sub(b"><", content)
+    return WHITESPACE_REGEX.sub(b" ", content).strip()
+
+
+def page_digest(content):
+    """
+    Hash the normalized contents of a web page.
+
+    :param str|bytes content: HTML code
+    :return str: hexadecimal SHA-256 digest
+    """
+    return hashlib.sha256(normalize_page(content)).hexdigest()
+
+
 def cut_url(url):
     """
     If URL is longer than 50 characters, show the last 45.
@@ -51,6 +108,26 @@ def cut_url(url):
     return url
 
 
+def normalize_url(url):
+    """
+    Normalize a URL so that URLs of the same page are equal: the scheme and
+    host are lowercased, the fragment is removed and query parameters are
+    sorted.
+
+    :param str url: absolute URL
+    :return str: normalized URL
+    """
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return parsed._replace(
+        scheme=parsed.scheme.lower(),
+        netloc=parsed.netloc.lower(),
+        path=parsed.path or "/",
+        query=query,
+        fragment="",
+    ).geturl()
+
+
 class LocalExploredSet:
     """
     Class that stores explored web pages contents implemented using the Python
@@ -85,18 +162,343 @@ class LocalExploredSet:
         self.explored.clear()
 
 
+class PersistentExploredSet:
+    """
+    Class that stores explored web pages as 64-bit hashes in an
+    open-addressing hash table, in a memory-mapped file. It uses 8 bytes per
+    slot, between 11 and 23 bytes per web page with the default maximum
+    load, and persists across runs, so a crawl can skip pages explored by a
+    previous crawl. It can be shared by threads.
+
+    Two web pages with the same hash are considered the same page, this
+    happens with a probability of about n / 2 ** 64 for n pages.
+    """
+    header = struct.Struct("<8sQQ")  # magic, capacity, count
+    magic = b"EXPLSET1"
+
+    def __init__(self, path, capacity=2 ** 16, max_load=0.7):
+        """
+        :param str path: path to the file which stores the set, it is created
+            if it does not exist
+        :param int capacity: initial number of slots of a new set, rounded up
+            to a power of 2, the set doubles its capacity when it is full
+        :param float max_load: maximum fraction of used slots
+        """
+        self.path = path
+        self.max_load = max_load
+        # the file is remapped when the set grows
+        self.lock = threading.Lock()
+        if not os.path.exists(self.path):
+            self._create(self.path, 1 << max(capacity - 1, 1).bit_length())
+        self._open()
+
+    def _create(self, path, capacity):
+        """
+        Create an empty set file.
+
+        :param str path: path to the file
+        :param int capacity: number of slots, must be a power of 2
+        """
+        with open(path, "wb") as f:
+            f.write(self.header.pack(self.magic, capacity, 0))
+            f.truncate(self.header.size + 8 * capacity)
+
+    def _open(self):
+        with open(self.path, "r+b") as f:
+            self.mm = mmap.mmap(f.fileno(), 0)
+        magic, self.capacity, self.count = self.header.unpack_from(self.mm)
+        if magic != self.magic:
+            self.mm.close()
+            raise ValueError(f"{self.path} is not an explored set file")
+        self.mask = self.capacity - 1
+        self.slots = memoryview(self.mm)[self.header.size:].cast("Q")
+
+    def close(self):
+        """
+        Write changes to disk and close the file.
+        """
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        self.slots.release()
+        self.mm.flush()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r}, {self.count} items)"
+
+    @staticmethod
+    def _hash(item):
+        h = hashlib.blake2b(item.encode(), digest_size=8).digest()
+        # 0 marks empty slots
+        return int.from_bytes(h, "little") or 1
+
+    def _find(self, h):
+        """
+        :param int h: hash of an item
+        :return int: index of the slot which has the hash, or of the empty
+            slot where it should be inserted
+        """
+        i = h & self.mask
+        while True:
+            slot = self.slots[i]
+            if slot == h or slot == 0:
+                return i
+            i = (i + 1) & self.mask
+
+    def __contains__(self, item):
+        h = self._hash(item)
+        with self.lock:
+            return self.slots[self._find(h)] == h
+
+    def add(self, *args):
+        """
+        Add args to the set.
+        Note: args should be of type 'string'.
+        """
+        for a in args:
+            if not isinstance(a, str):
+                raise TypeError(f"Expected {a} to be str, got {type(a)}")
+            h = self._hash(a)
+            with self.lock:
+                i = self._find(h)
+                if self.slots[i] == h:
+                    continue
+                self.slots[i] = h
+                self.count += 1
+                self.header.pack_into(
+                    self.mm, 0, self.magic, self.capacity, self.count
+                )
+                if self.count > self.max_load * self.capacity:
+                    self._grow()
+
+    def _grow(self):
+        """
+        Double the capacity of the set, the lock must be held.
+        """
+        tmp_path = f"{self.path}.tmp"
+        self._create(tmp_path, 2 * self.capacity)
+        with open(tmp_path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        slots = memoryview(mm)[self.header.size:].cast("Q")
+        mask = 2 * self.capacity - 1
+        for h in self.slots:
+            if h == 0:
+                continue
+            i = h & mask
+            while slots[i]:
+                i = (i + 1) & mask
+            slots[i] = h
+        self.header.pack_into(mm, 0, self.magic, 2 * self.capacity, self.count)
+        slots.release()
+        mm.flush()
+        mm.close()
+
+        self._close()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def clear(self):
+        """
+        Delete all items from the set.
+        """
+        with self.lock:
+            self.mm[self.header.size:] = bytes(8 * self.capacity)
+            self.count = 0
+            self.header.pack_into(self.mm, 0, self.magic, self.capacity, 0)
+
+
+class ValidatorStore:
+    """
+    Store the validators of downloaded web pages, to send conditional
+    requests when pages are downloaded again: the ETag and Last-Modified
+    headers of the response, and a hash of the normalized page contents (see
+    page_digest()) for servers which do not send validators.
+    """
+    def __init__(self, path, commit_every=100):
+        """
+        :param str path: path of the SQLite database, created if it does not
+            exist
+        :param int commit_every: number of updates committed together
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                digest TEXT,
+                checked_at REAL NOT NULL
+            )
+            """
+        )
+        self.uncommitted = 0
+        # URL -> (ETag, Last-Modified, digest) of pages not processed yet
+        self.pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"ValidatorStore({self.path!r})"
+
+    def get(self, url):
+        """
+        Get the validators of a web page.
+
+        :param str url: URL of the web page
+        :return dict: validators, or None if the page was never downloaded
+        """
+        with self.lock:
+            row = self.db.execute(
+                """
+                SELECT etag, last_modified, digest, checked_at
+                FROM validators WHERE url = ?
+                """,
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("etag", "last_modified", "digest", "checked_at")
+        return dict(zip(keys, row))
+
+    def request_headers(self, url):
+        """
+        Make the headers of a conditional request for a web page.
+
+        :param str url: URL of the web page
+        :return dict: If-None-Match and If-Modified-Since headers, empty if
+            the page was never downloaded
+        """
+        validators = self.get(url)
+        headers = {}
+        if validators is None:
+            return headers
+        if validators["etag"]:
+            headers["If-None-Match"] = validators["etag"]
+        if validators["last_modified"]:
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def check(self, url, status, headers, content):
+        """
+        Check if a downloaded web page changed since it was last downloaded.
+        The new validators of a changed page are kept in memory until save()
+        is called, e.g. once the page is stored, so a page which could not be
+        processed is not reported as unchanged when it is downloaded again.
+
+        :param str url: URL of the web page
+        :param int status: HTTP status code of the response
+        :param headers: headers of the response, case-insensitive mapping
+        :param bytes content: contents of the web page
+        :return bool: False if the server answered 304 Not Modified or if
+            the page contents did not change
+        """
+        if status == 304:
+            return False
+        previous = self.get(url)
+        digest = page_digest(content)
+        if previous is not None and previous["digest"] == digest:
+            return False
+        with self.lock:
+            self.pending[url] = (
+                headers.get("ETag"),
+                headers.get("Last-Modified"),
+                digest,
+            )
+        return True
+
+    def save(self, url):
+        """
+        Save the validators of a web page checked with check(), once it was
+        processed. Does nothing if the page has no new validators.
+
+        :param str url: URL of the web page
+        """
+        with self.lock:
+            validators = self.pending.pop(url, None)
+            if validators is None:
+                return
+            self.db.execute(
+                "INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?)",
+                (url, *validators, time.time()),
+            )
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.db.commit()
+                self.uncommitted = 0
+
+    def flush(self):
+        """
+        Commit pending changes to disk.
+        """
+        with self.lock:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
 class LocalQueue:
     """
     In-memory queue implemented using the Python class collections.deque.
     """
-    def __init__(self):
+    def __init__(self, max_receives=None):
+        """
+        :param int max_receives: number of times an item can be given back
+            with nack() before it is moved to self.dead_letters, unlimited
+            by default
+        """
         self.queue = deque()
+        self.max_receives = max_receives
+        self.receives = {}
+        self.dead_letters = []
 
     def enqueue(self, item):
         self.queue.appendleft(item)
 
     def dequeue(self):
-        return self.queue.pop()
+        try:
+            return self.queue.pop()
+        except IndexError:
+            return None
+
+    def ack(self, item):
+        self.receives.pop(item, None)
+
+    def nack(self, item):
+        if self.max_receives:
+            count = self.receives.get(item, 0) + 1
+            if count >= self.max_receives:
+                logging.warning(
+                    f"giving up on {cut_url(item)} after {count} attempts"
+                )
+                self.receives.pop(item, None)
+                self.dead_letters.append(item)
+                return
+            self.receives[item] = count
+        self.enqueue(item)
 
     def __len__(self):
         return len(self.queue)
@@ -106,6 +508,394 @@ class LocalQueue:
         return len(self.queue) == 0
 
 
+class LocalPriorityQueue:
+    """
+    In-memory priority queue implemented using the Python module heapq.
+    Items with the lowest score are dequeued first, in insertion order for
+    equal scores. Enqueueing and dequeueing take O(log n) time.
+
+    The score is given by a function of the item, e.g. page_number() to
+    browse the first pages of listings, which have the newest listings,
+    first.
+    """
+    def __init__(self, score=None, max_receives=None):
+        """
+        :param callable score: function which takes an item and returns its
+            priority, lowest first, items are dequeued in insertion order by
+            default
+        :param int max_receives: number of times an item can be given back
+            with nack() before it is moved to self.dead_letters, unlimited
+            by default
+        """
+        self.score = score
+        self.max_receives = max_receives
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.receives = {}
+        self.dead_letters = []
+
+    def enqueue(self, item):
+        priority = self.score(item) if self.score else 0
+        with self.lock:
+            heapq.heappush(self.heap, (priority, next(self.counter), item))
+
+    def dequeue(self):
+        with self.lock:
+            if not self.heap:
+                return None
+            return heapq.heappop(self.heap)[2]
+
+    def ack(self, item):
+        self.receives.pop(item, None)
+
+    def nack(self, item):
+        if self.max_receives:
+            count = self.receives.get(item, 0) + 1
+            if count >= self.max_receives:
+                logging.warning(
+                    f"giving up on {cut_url(item)} after {count} attempts"
+                )
+                self.receives.pop(item, None)
+                self.dead_letters.append(item)
+                return
+            self.receives[item] = count
+        self.enqueue(item)
+
+    def __len__(self):
+        return len(self.heap)
+
+    @property
+    def is_empty(self):
+        return len(self.heap) == 0
+
+
+def url_depth(url):
+    """
+    Score a URL by the depth of its path, to browse shallow pages first.
+
+    :param str url: URL to score
+    :return int: number of segments in the URL's path
+    """
+    return len([p for p in urlparse(url).path.split("/") if p])
+
+
+def page_number(url):
+    """
+    Score a URL by its page number, e.g. 'page=3', 'p=3', 's=240' or
+    '/3_p/', to browse the first pages of listings first: listings are
+    sorted by date, so the first pages have the newest listings.
+
+    :param str url: URL to score
+    :return int: page number, or 0 if the URL has no page number
+    """
+    match = PAGE_NUMBER_REGEX.search(url)
+    if match:
+        return int(match.group(1) or match.group(2))
+    return 0
+
+
+def harvest_age(harvest_store, get_page_id):
+    """
+    Make a score function which ranks pages by the time they were last
+    harvested, to download pages whose data is the oldest first. Pages
+    which were never harvested come first.
+
+    :param IndexedZipHarvestStore harvest_store: store of harvested pages
+    :param callable get_page_id: function which returns the name of a page
+        in the store from its URL
+    :return callable: function which takes a URL and returns the Unix
+        timestamp of its last harvest, or 0
+    """
+    def score(url):
+        page = harvest_store.lookup(get_page_id(url))
+        if page is None:
+            return 0
+        return page["harvested_at"]
+    return score
+
+
+class PersistentQueue:
+    """
+    Durable local queue stored in a SQLite database, so a crawl can resume
+    where it stopped after a crash, without SQS.
+
+    The database is in WAL mode and changes are committed, and synced to
+    disk, in batches of 'commit_every' operations and when the queue is
+    flushed or closed: a crash loses at most the last batch. Dequeued items
+    are kept until they are acknowledged with ack(), and items which were
+    dequeued but not acknowledged when the queue was closed are dequeued
+    again when it is reopened.
+
+    With a 'score' function, the queue is a priority queue like
+    LocalPriorityQueue: items with the lowest score are dequeued first.
+    """
+    def __init__(
+        self,
+        path,
+        commit_every=1000,
+        max_receives=None,
+        score=None,
+    ):
+        """
+        :param str path: path of the SQLite database, created if it does not
+            exist
+        :param int commit_every: number of operations committed together
+        :param int max_receives: number of times an item can be given back
+            with nack() before it is moved to the dead letters, unlimited
+            by default
+        :param callable score: function which takes an item and returns its
+            priority, lowest first, items are dequeued in insertion order by
+            default
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self.max_receives = max_receives
+        self.score = score
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item TEXT NOT NULL,
+                leased INTEGER NOT NULL DEFAULT 0,
+                receives INTEGER NOT NULL DEFAULT 0,
+                priority REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self.db.execute(
+            """
+            CREATE INDEX IF NOT EXISTS items_priority ON items (priority, id)
+            WHERE leased = 0
+            """
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters (item TEXT NOT NULL)"
+        )
+
+        # redeliver items which were not acknowledged
+        self.db.execute("UPDATE items SET leased = 0 WHERE leased = 1")
+        self.db.commit()
+        self.uncommitted = 0
+        # item -> deque of row IDs of dequeued items, the same item may be
+        # dequeued several times, e.g. if it was enqueued twice
+        self.leases = {}
+        self.length = self.db.execute(
+            "SELECT COUNT(*) FROM items"
+        ).fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return f"PersistentQueue({self.path!r})"
+
+    @property
+    def is_empty(self):
+        return self.length == 0
+
+    def _changed(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def _insert(self, item, receives=0):
+        priority = self.score(item) if self.score else 0
+        self.db.execute(
+            "INSERT INTO items (item, receives, priority) VALUES (?, ?, ?)",
+            (item, receives, priority),
+        )
+        self.length += 1
+
+    def enqueue(self, item):
+        with self.lock:
+            self._insert(item)
+            self._changed()
+
+    def dequeue(self):
+        with self.lock:
+            row = self.db.execute(
+                """
+                SELECT id, item FROM items WHERE leased = 0
+                ORDER BY priority, id LIMIT 1
+                """
+            ).fetchone()
+            if row is None:
+                return None
+            row_id, item = row
+            self.db.execute(
+                "UPDATE items SET leased = 1 WHERE id = ?",
+                (row_id,),
+            )
+            self.leases.setdefault(item, deque()).append(row_id)
+            self.length -= 1
+            self._changed()
+            return item
+
+    def _pop_lease(self, item):
+        """
+        Remove the lease of a dequeued item, the lock must be held.
+
+        :param str item: dequeued item
+        :return int: row ID of the item, or None if it is not leased
+        """
+        row_ids = self.leases.get(item)
+        if not row_ids:
+            return None
+        row_id = row_ids.popleft()
+        if not row_ids:
+            del self.leases[item]
+        return row_id
+
+    def ack(self, item):
+        """
+        Delete a dequeued item, once it has been processed.
+
+        :param str item: dequeued item
+        """
+        with self.lock:
+            row_id = self._pop_lease(item)
+            if row_id is None:
+                return
+            self.db.execute("DELETE FROM items WHERE id = ?", (row_id,))
+            self._changed()
+
+    def nack(self, item):
+        """
+        Give a dequeued item which could not be processed back to the queue,
+        or move it to the dead letters after 'max_receives' attempts.
+
+        :param str item: dequeued item
+        """
+        with self.lock:
+            row_id = self._pop_lease(item)
+            receives = 0
+            if row_id is not None:
+                receives = self.db.execute(
+                    "SELECT receives FROM items WHERE id = ?",
+                    (row_id,),
+                ).fetchone()[0]
+                self.db.execute("DELETE FROM items WHERE id = ?", (row_id,))
+            receives += 1
+            if self.max_receives and receives >= self.max_receives:
+                logging.warning(
+                    f"giving up on {cut_url(item)} after {receives} attempts"
+                )
+                self.db.execute(
+                    "INSERT INTO dead_letters VALUES (?)",
+                    (item,),
+                )
+            else:
+                self._insert(item, receives)
+            self._changed()
+
+    @property
+    def dead_letters(self):
+        with self.lock:
+            return [
+                item for item, in self.db.execute(
+                    "SELECT item FROM dead_letters"
+                )
+            ]
+
+    def flush(self):
+        """
+        Commit pending changes to disk.
+        """
+        with self.lock:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class BoundedQueue:
+    """
+    Thread-safe in-memory queue with a maximum size, implemented using the
+    Python class queue.Queue. Enqueueing blocks while the queue is full, which
+    applies backpressure on producers.
+
+    Closing the queue, e.g. when its consumers failed, wakes up blocked
+    producers and consumers: enqueue() then raises a RuntimeError and
+    dequeue() returns None.
+    """
+    # how often blocked calls check if the queue was closed, in seconds
+    poll_interval = 0.1
+
+    def __init__(self, maxsize=0, timeout=None):
+        """
+        :param int maxsize: maximum number of items in the queue, 0 means no
+            limit
+        :param float timeout: maximum time in seconds dequeue() waits for an
+            item before returning None, by default it waits forever
+        """
+        self.queue = queue.Queue(maxsize)
+        self.timeout = timeout
+        self.closed = threading.Event()
+
+    def enqueue(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("cannot enqueue, the queue is closed")
+
+    def dequeue(self):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        while not self.closed.is_set():
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return None
+            try:
+                return self.queue.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return None
+
+    def close(self):
+        """
+        Close the queue, items it contains can be retrieved with drain().
+        """
+        self.closed.set()
+
+    def drain(self):
+        """
+        :return list: items left in the queue, which is emptied
+        """
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    @property
+    def is_empty(self):
+        return self.queue.empty()
+
+
 class RobotParser:
     def __init__(self, base_url, user_agent=None):
         self.base_url = base_url
@@ -140,11 +930,148 @@ class RobotParser:
         return False
 
 
+class TokenBucketScheduler:
+    """
+    Per-host token bucket shared by concurrent download workers.
+
+    Each host gets a bucket refilled at one token every 'request_delay'
+    seconds and holding at most 'burst' tokens. Workers reserve a token before
+    each request, so the crawl delay is honoured across all workers combined
+    while their network round-trips overlap.
+    """
+    def __init__(self, base_url, request_delay, burst=1):
+        """
+        :param str base_url: URL used to resolve relative URLs to a host
+        :param float request_delay: minimum average delay in seconds between
+            two requests to the same host, e.g. RobotParser.request_delay
+        :param int burst: maximum number of requests allowed back-to-back
+        """
+        self.base_url = base_url
+        self.request_delay = request_delay or 0
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, url):
+        """
+        Take a token from the bucket of the URL's host, possibly borrowing
+        it from the future.
+
+        :param str url: URL about to be requested
+        :return float: time in seconds to wait before sending the request
+        """
+        if self.request_delay <= 0:
+            return 0
+        host = urlparse(urljoin(self.base_url, url)).netloc
+        with self.lock:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(host, (self.burst, now))
+            refill = (now - last) / self.request_delay
+            tokens = min(self.burst, tokens + refill) - 1
+            self.buckets[host] = (tokens, now)
+        if tokens >= 0:
+            return 0
+        return -tokens * self.request_delay
+
+    def wait(self, url):
+        """
+        Block until a request to the URL's host is allowed.
+
+        :param str url: URL about to be requested
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, url):
+        """
+        Same as wait() but does not block the event loop.
+
+        :param str url: URL about to be requested
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
 class SQSQueue:
-    def __init__(self, queue_url, wait_seconds=20):
+    """
+    Queue implemented with AWS SQS.
+
+    Messages can be sent, received and deleted in batches of up to 10, which
+    divides the number of API calls. With a 'batch_size' greater than 1,
+    enqueue() buffers messages until a batch is full and dequeue() receives a
+    batch of messages and returns them one by one. Buffered messages are sent
+    by flush(), which should be called when done enqueueing.
+
+    The queue length, which includes messages in flight, is cached: it is
+    updated locally when messages are sent and received, and only fetched
+    from SQS when the cache is older than 'cache_ttl' seconds or when the
+    local count says the queue is empty.
+
+    With 'lease' set, received messages are not deleted: they stay invisible
+    to other consumers while a background thread extends their visibility
+    timeout, and are only deleted when the consumer calls ack(), e.g. once
+    the page is stored. nack() makes a message visible again, or moves it to
+    the dead-letter queue once it was received 'max_receives' times. If the
+    consumer crashes, its messages become visible again when their
+    visibility timeout expires.
+    """
+    max_batch_size = 10
+
+    def __init__(
+        self,
+        queue_url,
+        wait_seconds=20,
+        batch_size=1,
+        client=None,
+        endpoint_url=None,
+        cache_ttl=30,
+        lease=False,
+        visibility_timeout=60,
+        max_receives=3,
+        dead_letter_url=None,
+    ):
+        """
+        :param str queue_url: URL of the SQS queue
+        :param int wait_seconds: maximum time waiting for messages when
+            receiving
+        :param int batch_size: number of messages to send and receive per API
+            call, at most 10
+        :param client: SQS client, by default a boto3 client is created, e.g.
+            for a local SQS stand-in
+        :param str endpoint_url: URL of the SQS service if a boto3 client is
+            created, e.g. to use a local SQS stand-in such as ElasticMQ
+        :param float cache_ttl: maximum age in seconds of the cached queue
+            length
+        :param bool lease: delete messages when acknowledged instead of when
+            received
+        :param int visibility_timeout: time in seconds a received message
+            stays invisible, extended while the message is held
+        :param int max_receives: number of times a message is received before
+            nack() gives up on it
+        :param str dead_letter_url: URL of the SQS queue where nack() sends
+            messages it gives up on, they are dropped if not given
+        """
         self.queue_url = queue_url
         self.wait_seconds = wait_seconds
-        self.client = boto3.client("sqs")
+        self.batch_size = min(batch_size, self.max_batch_size)
+        self.client = client or boto3.client("sqs", endpoint_url=endpoint_url)
+        self.send_buffer = []
+        self.receive_buffer = deque()
+        self.lock = threading.Lock()
+        self.cache_ttl = cache_ttl
+        self.remote_count = 0
+        self.refreshed_at = None
+        self.lease = lease
+        self.visibility_timeout = visibility_timeout
+        self.max_receives = max_receives
+        self.dead_letter_url = dead_letter_url
+        # message body -> deque of [receipt handle, receive count], the same
+        # item may be received several times, e.g. if it was enqueued twice
+        self.leases = {}
+        self.heartbeat = None
+        self.stop_heartbeat = threading.Event()
 
     def enqueue(self, item):
         """
@@ -152,11 +1079,72 @@ class SQSQueue:
 
         :param str item: item to push to add to the queue
         """
+        if self.batch_size > 1:
+            with self.lock:
+                self.send_buffer.append(item)
+                if len(self.send_buffer) < self.batch_size:
+                    return
+                items = self.send_buffer
+                self.send_buffer = []
+            self.enqueue_many(items)
+            return
+
         response = self.client.send_message(
             QueueUrl=self.queue_url,
             MessageBody=item,
         )
         check_status(response)
+        self._count(1)
+
+    def _count(self, n):
+        """
+        Update the cached number of messages in the queue.
+
+        :param int n: number of messages added, negative if removed
+        """
+        with self.lock:
+            self.remote_count += n
+
+    def enqueue_many(self, items, max_attempts=3):
+        """
+        Enqueue items into an SQS queue, in batches of 10 items.
+
+        :param list[str] items: items to push to add to the queue
+        :param int max_attempts: number of times sending an item is attempted
+        :raises ValueError: if some items could not be sent
+        """
+        for start in range(0, len(items), self.max_batch_size):
+            entries = [
+                {"Id": str(i), "MessageBody": item}
+                for i, item in enumerate(
+                    items[start:start + self.max_batch_size]
+                )
+            ]
+            for _ in range(max_attempts):
+                response = self.client.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=entries,
+                )
+                check_status(response)
+                failed = {f["Id"] for f in response.get("Failed", [])}
+                self._count(len(entries) - len(failed))
+                entries = [e for e in entries if e["Id"] in failed]
+                if not entries:
+                    break
+            else:
+                raise ValueError(
+                    f"failed to send {len(entries)} messages to the queue"
+                )
+
+    def flush(self):
+        """
+        Send the messages buffered by enqueue().
+        """
+        with self.lock:
+            items = self.send_buffer
+            self.send_buffer = []
+        if items:
+            self.enqueue_many(items)
 
     def dequeue(self):
         """
@@ -164,34 +1152,264 @@ class SQSQueue:
 
         :return str: message body of an item from the queue
         """
+        try:
+            return self.receive_buffer.popleft()
+        except IndexError:
+            pass
+
+        # buffered messages may be the only ones left
+        self.flush()
+        bodies = self.dequeue_many(self.batch_size)
+        if bodies:
+            self.receive_buffer.extend(bodies[1:])
+            return bodies[0]
+
+    def dequeue_many(self, max_messages=10):
+        """
+        Dequeue up to 10 items from an SQS queue.
+
+        :param int max_messages: maximum number of items to dequeue
+        :return list[str]: message bodies of items from the queue
+        """
+        if self.lease:
+            return self._lease_many(max_messages)
+
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            WaitTimeSeconds=self.wait_seconds,
+            MaxNumberOfMessages=min(max_messages, self.max_batch_size),
+        )
+        check_status(response)
+        messages = response.get("Messages")
+        if not messages:
+            return []
+
+        self._count(-len(messages))
+        response = self.client.delete_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": m.get("ReceiptHandle")}
+                for i, m in enumerate(messages)
+            ],
+        )
+        check_status(response)
+        for failure in response.get("Failed", []):
+            logging.warning(
+                f"failed to delete message: {failure.get('Message')}"
+            )
+        return [m.get("Body") for m in messages]
+
+    def _lease_many(self, max_messages):
+        """
+        Receive up to 10 items from an SQS queue without deleting them.
+
+        :param int max_messages: maximum number of items to receive
+        :return list[str]: message bodies of items from the queue
+        """
         response = self.client.receive_message(
             QueueUrl=self.queue_url,
-            WaitTimeSeconds=self.wait_seconds
+            WaitTimeSeconds=self.wait_seconds,
+            MaxNumberOfMessages=min(max_messages, self.max_batch_size),
+            VisibilityTimeout=self.visibility_timeout,
+            AttributeNames=["ApproximateReceiveCount"],
         )
         check_status(response)
         messages = response.get("Messages")
-        if messages:
-            # we only receive one message at a time
-            handle = messages[0].get("ReceiptHandle")
-            body = messages[0].get("Body")
-            self.client.delete_message(
+        if not messages:
+            return []
+
+        with self.lock:
+            for m in messages:
+                count = m.get("Attributes", {}).get(
+                    "ApproximateReceiveCount", 1
+                )
+                self.leases.setdefault(m.get("Body"), deque()).append(
+                    [m.get("ReceiptHandle"), int(count)]
+                )
+            if self.heartbeat is None:
+                self.stop_heartbeat.clear()
+                self.heartbeat = threading.Thread(
+                    target=self._extend_leases,
+                    daemon=True,
+                )
+                self.heartbeat.start()
+        return [m.get("Body") for m in messages]
+
+    def _extend_leases(self):
+        """
+        Extend the visibility timeout of held messages until release() is
+        called. Runs in a background thread.
+        """
+        while not self.stop_heartbeat.wait(self.visibility_timeout / 2):
+            with self.lock:
+                handles = [
+                    handle
+                    for leases in self.leases.values()
+                    for handle, _ in leases
+                ]
+            for start in range(0, len(handles), self.max_batch_size):
+                try:
+                    response = self.client.change_message_visibility_batch(
+                        QueueUrl=self.queue_url,
+                        Entries=[
+                            {
+                                "Id": str(i),
+                                "ReceiptHandle": handle,
+                                "VisibilityTimeout": self.visibility_timeout,
+                            }
+                            for i, handle in enumerate(
+                                handles[start:start + self.max_batch_size]
+                            )
+                        ],
+                    )
+                    check_status(response)
+                except Exception as e:
+                    logging.warning(f"failed to extend leases: {e}")
+
+    def _pop_lease(self, item):
+        """
+        Remove the lease of a received item.
+
+        :param str item: message body of the item
+        :return list: receipt handle and receive count of the message, or None
+            if the item is not leased
+        """
+        with self.lock:
+            leases = self.leases.get(item)
+            if not leases:
+                return None
+            lease = leases.popleft()
+            if not leases:
+                del self.leases[item]
+        return lease
+
+    def ack(self, item):
+        """
+        Delete a received item from the queue, once it has been processed.
+
+        :param str item: message body of the item
+        """
+        lease = self._pop_lease(item)
+        if lease is None:
+            return
+        response = self.client.delete_message(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=lease[0],
+        )
+        check_status(response)
+        self._count(-1)
+
+    def nack(self, item):
+        """
+        Give a received item back to the queue because it could not be
+        processed. After 'max_receives' attempts, the item is sent to the
+        dead-letter queue instead.
+
+        :param str item: message body of the item
+        """
+        lease = self._pop_lease(item)
+        if lease is None:
+            # the item was not leased, e.g. the queue is not in lease mode
+            self.enqueue(item)
+            return
+
+        handle, count = lease
+        if count < self.max_receives:
+            response = self.client.change_message_visibility(
                 QueueUrl=self.queue_url,
                 ReceiptHandle=handle,
+                VisibilityTimeout=0,
             )
-            return body
+            check_status(response)
+            return
 
-    def __len__(self):
-        resp = self.client.get_queue_attributes(
+        logging.warning(
+            f"giving up on {cut_url(item)} after {count} attempts"
+        )
+        if self.dead_letter_url:
+            response = self.client.send_message(
+                QueueUrl=self.dead_letter_url,
+                MessageBody=item,
+            )
+            check_status(response)
+        response = self.client.delete_message(
             QueueUrl=self.queue_url,
-            AttributeNames=["ApproximateNumberOfMessages"]
+            ReceiptHandle=handle,
         )
-        check_status(resp)
-        n = resp.get("Attributes", {}).get("ApproximateNumberOfMessages", 0)
-        return int(n)
+        check_status(response)
+        self._count(-1)
+
+    def release(self):
+        """
+        Stop extending leases and give prefetched items back to the queue.
+        Items being processed become visible again when their visibility
+        timeout expires, unless they are acknowledged.
+        """
+        self.stop_heartbeat.set()
+        if self.heartbeat is not None:
+            self.heartbeat.join()
+            self.heartbeat = None
+        while self.receive_buffer:
+            item = self.receive_buffer.popleft()
+            lease = self._pop_lease(item)
+            if lease is not None:
+                self.client.change_message_visibility(
+                    QueueUrl=self.queue_url,
+                    ReceiptHandle=lease[0],
+                    VisibilityTimeout=0,
+                )
+
+    def _remote_len(self, refresh=False):
+        """
+        Get the number of messages in SQS, visible or in flight, from the
+        cache.
+
+        :param bool refresh: fetch the number of messages from SQS even if the
+            cache is not expired
+        :return int: number of messages
+        """
+        now = time.monotonic()
+        if (
+            refresh
+            or self.refreshed_at is None
+            or now - self.refreshed_at > self.cache_ttl
+        ):
+            resp = self.client.get_queue_attributes(
+                QueueUrl=self.queue_url,
+                AttributeNames=[
+                    "ApproximateNumberOfMessages",
+                    "ApproximateNumberOfMessagesNotVisible",
+                ]
+            )
+            check_status(resp)
+            attributes = resp.get("Attributes", {})
+            with self.lock:
+                self.remote_count = (
+                    int(attributes.get("ApproximateNumberOfMessages", 0))
+                    + int(
+                        attributes.get(
+                            "ApproximateNumberOfMessagesNotVisible", 0
+                        )
+                    )
+                )
+                self.refreshed_at = now
+        return max(self.remote_count, 0)
+
+    def _local_len(self):
+        # leased messages are in flight, they are already counted by SQS
+        if self.lease:
+            return len(self.send_buffer)
+        return len(self.receive_buffer) + len(self.send_buffer)
+
+    def __len__(self):
+        return self._remote_len() + self._local_len()
 
     @property
     def is_empty(self):
-        return len(self) == 0
+        if len(self) > 0:
+            return False
+        # make sure the queue is empty and the cache is not just stale
+        return self._remote_len(refresh=True) + self._local_len() == 0
 
 
 class TimeoutError(Exception):
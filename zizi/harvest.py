@@ -7,6 +7,7 @@ sys.path.insert(0, os.path.join(str(Path.home()), "real-estate-scraping"))
 
 from zizi.browse import get_listing_id
 from selenium_browser import Browser
+from selenium_utils import ResourceFilter
 
 
 def main():
@@ -15,6 +16,10 @@ def main():
         get_page_id=get_listing_id,
         wait_page_load=30,
         config_file="zillow.conf",
+        resource_filter=ResourceFilter.for_site(
+            "https://www.zillow.com",
+            extra_domains=("zillowstatic.com",),
+        ),
     )
     crawler.harvest()
     crawler.close()
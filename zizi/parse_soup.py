@@ -1,12 +1,25 @@
-import functools
 import logging
-import math
 import re
 import sys
 
 sys.path.insert(0, "../")
 
 from neighborhood_burrough_mapping import NEIGHBORHOOD_BURROUGH_MAPPING
+from parse_plan import (
+    Extractor,
+    field,
+    find,
+    find_all,
+    next_node,
+    next_sibling,
+    node_text,
+    nodes,
+    parse_region,
+    region,
+    select,
+    text,
+)
+from parsing_utils import safety_net, string_to_float, string_to_int, to_null
 
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
@@ -16,75 +29,6 @@ logging.basicConfig(
 BURROUGHS = {"bronx", "brooklyn", "new york", "queens", "staten island"}
 
 
-def safety_net(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except Exception:
-            logging.error(f"html tag parsing failed with '{func.__name__}'")
-    return wrapper
-
-
-def string_to_float(string):
-    """
-    Convert a string representing a number to a float.
-
-    :param str string: string to convert
-    :return float:
-    """
-    remap = {
-        ord(","): None,
-        ord("$"): None,
-        ord("\xa0"): None,
-    }
-    clean = string.translate(remap)
-    try:
-        return float(clean)
-    except ValueError:
-        return float("nan")
-
-
-def string_to_int(string):
-    """
-    Convert a string representing a number to a int.
-    Return 'NaN' if the string can't be converted to an integer.
-
-    :param str string: string to convert
-    :return int|nan:
-    """
-    remap = {
-        ord(","): None,
-        ord("$"): None,
-        ord("\xa0"): None,
-    }
-    clean = string.translate(remap)
-    try:
-        return int(clean)
-    except ValueError:
-        return float("nan")
-
-
-def to_null(d):
-    """
-    Convert the NaN (not a number) or empty values of a dictionary to the
-    string 'NULL'.
-
-    :param dict d: dictionary to convert
-    :return dict: dictionary where NaN and empty values are 'NULL'
-    """
-    for key, value in d.items():
-        if isinstance(value, float):
-            if math.isnan(value):
-                d[key] = "NULL"
-        elif isinstance(value, str):
-            if not value:
-                d[key] = "NULL"
-        elif value is None:
-            d[key] = "NULL"
-    return d
-
-
 @safety_net
 def get_rent_price(soup):
     """
@@ -410,3 +354,182 @@ def parse_webpage(soup):
     results["agency"] = get_agency_url(soup)
     results = to_null(results)
     return results
+
+
+# selectors of the tags the fields are extracted from
+DETAILS_CHIP = select("div", {"class": "ds-home-details-chip"})
+ADDRESS = select("h1", {"class": "ds-address-container"})
+BUILDINGS_ICON = select("i", {"class": "zsg-icon-buildings"})
+AGENT_NAME = select("span", {"class": "ds-listing-agent-display-name"})
+AGENT_BUSINESS = select("span", {"class": "ds-listing-agent-business-name"})
+OVERVIEW_SECTION = select("div", {"class": "ds-overview-section"})
+OVERVIEW = select("div", {"class": "ds-overview"})
+FACTS = select("li", {"class": "ds-home-fact-list-item"}, many=True)
+BED_BATH = select("h3", {"class": "ds-bed-bath-living-area-container"})
+H3 = select("h3", many=True)
+
+# classes of the home facts icons mapped to the names of the amenities
+AMENITY_ICONS = {
+    "zsg-icon-snowflake": "cooling",
+    "zsg-icon-heating": "heating",
+    "zsg-icon-pets": "pets",
+    "zsg-icon-parking": "parking",
+    "zsg-icon-laundry": "laundry",
+}
+
+
+def address_text(container):
+    return text(container).replace("\xa0", " ")
+
+
+def address_from_container(container):
+    address = address_text(container)
+    found_zip = re.search(r",\sNY\s\d{5}", address)
+    if found_zip:
+        return address[:found_zip.span()[0]]
+    return address
+
+
+def neighborhood_from_container(container):
+    splitted = address_from_container(container).split(",")[-1].strip()
+    if splitted.lower() not in BURROUGHS:
+        return splitted
+
+
+def burrough_from_container(container):
+    splitted = address_from_container(container).split(",")[-1].strip()
+    if splitted.lower() in BURROUGHS:
+        return splitted
+    return NEIGHBORHOOD_BURROUGH_MAPPING.get(splitted.lower(), "NULL")
+
+
+def zip_from_container(container):
+    found_zip = re.search(r",\sNY\s(\d{5})", address_text(container))
+    if found_zip:
+        return found_zip.group(1)
+
+
+def amenities_from_facts(facts):
+    default_text = "contact manager"
+    amenities_list = []
+    for fact in facts:
+        classes = next_node(fact).get("class", "").split()
+        for icon, amenity in AMENITY_ICONS.items():
+            if icon in classes:
+                value = node_text(next_node(fact, 4)).lower()
+                if value != default_text:
+                    amenities_list.append(f"{amenity}: {value}")
+                break
+    return ", ".join(amenities_list)
+
+
+def days_listed_from_overview(overview):
+    for div in find_all(overview, "div"):
+        if text(div) == "Days listed":
+            return node_text(next_node(div, 3))
+
+
+def bed_bath(index, process=None):
+    """
+    Make a post-processor which reads the first word of a child of the beds
+    and baths container.
+
+    :param int index: index of the child, including text
+    :param callable process: function which takes the first word
+    :return callable: post-processor
+    """
+    def process_container(container):
+        word = node_text(nodes(container)[index]).split()[0]
+        return process(word) if process else word
+    return process_container
+
+
+def bedrooms_from_word(word):
+    if "--" in word:
+        return 0
+    return word
+
+
+def half_bathrooms_from_word(word):
+    if ".5" in word:
+        return 1
+    return 0
+
+
+def feature(label):
+    """
+    Make a post-processor which reads a feature following the second h3.
+
+    :param str label: lowercase label of the feature
+    :return callable: post-processor
+    """
+    def process_features(h3s):
+        for f in next_sibling(h3s[1]):
+            if text(find(f, "div")).lower() == label:
+                return text(find(f, "p"))
+    return process_features
+
+
+SPEC = {
+    "listing_type": field(H3, feature("property type"), str),
+    "property_type": field(
+        BUILDINGS_ICON, lambda icon: node_text(next_node(icon, 3))
+    ),
+    "burrough": field(ADDRESS, burrough_from_container),
+    "neighborhood": field(ADDRESS, neighborhood_from_container),
+    "address": field(ADDRESS, address_from_container),
+    "zip": field(ADDRESS, zip_from_container),
+    "price": field(
+        DETAILS_CHIP,
+        lambda chip: text(find(chip, "span", {"class": "ds-value"})),
+        float,
+    ),
+    "description": field(
+        OVERVIEW_SECTION,
+        lambda div: node_text(next_node(div)).replace("\n", " "),
+    ),
+    "amenities": field(FACTS, amenities_from_facts),
+    "common_charges": field(),
+    "monthly_taxes": field(),
+    "days_listed": field(OVERVIEW, days_listed_from_overview, int),
+    "size": field(BED_BATH, bed_bath(4), int),
+    "year_built": field(H3, feature("build"), str),
+    "bedrooms": field(BED_BATH, bed_bath(0, bedrooms_from_word), int),
+    "bathrooms": field(
+        BED_BATH, bed_bath(2, lambda word: word.split(".")[0]), int
+    ),
+    "half_bathrooms": field(BED_BATH, bed_bath(2, half_bathrooms_from_word)),
+    "rooms": field(),
+    "representative": field(AGENT_NAME),
+    "agency": field(AGENT_BUSINESS),
+}
+
+EXTRACTOR = Extractor(SPEC)
+
+# part of the pages containing the listing, the head and scripts are not
+# parsed
+REGION = region(start=b"<body")
+
+
+def parse_html(content):
+    """
+    Parse the part of a web page which contains the listing with lxml, to
+    use with parse_tree().
+
+    :param bytes|str content: HTML code
+    :return lxml.html.HtmlElement: root of the region's tree
+    """
+    return parse_region(content, REGION)
+
+
+def parse_tree(root):
+    """
+    Same as parse_webpage() but parses a page parsed with lxml (see
+    parse_html()), which is much faster: all tags are found in a
+    single traversal of the page.
+
+    :param lxml.html.HtmlElement root: root of the page's tree
+    :return dict: keys are home listing attributes and values are the
+                  corresponding values parsed from HTML
+    """
+    return EXTRACTOR.run(root)
@@ -57,7 +57,8 @@ def wait_queue_empty():
 def extract(**context):
     crawler = Browser(
         base_url=BASE_URL,
-        soup_parser=zizi.parse_soup.parse_webpage,
+        soup_parser=zizi.parse_soup.parse_tree,
+        extract_parser=zizi.parse_soup.parse_html,
         harvest_date=context["ds_nodash"],
         wait_page_load=30,
         config_file=CONFIG_FILE,